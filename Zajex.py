@@ -5,8 +5,10 @@ Created on 29.01.2024
 @author: Zajicek
 @author: Vopalensky
 """
+import os
 import sys
 from argparse import ArgumentParser
+from dataclasses import replace
 from queue import Queue
 
 from PyQt5.QtCore import Qt
@@ -40,15 +42,26 @@ class Main(QMainWindow, Ui_MainWindow):
 
         self.curr_image = None
         self.last_image_id = None
-        self.images = {}
+        self.images = ImageStore(self.parameters.memory_budget * 2 ** 20, codec=self.parameters.memory_codec)
         self.last_action_ = None
 
         self.loading_queue = Queue()
-        self.loading_thread = ImageLoaderThread(self, image_queue=self.loading_queue)
+        self.loading_thread = ImageLoaderThread(self, image_queue=self.loading_queue,
+                                                workers=self.parameters.loader_workers,
+                                                pool=self.parameters.loader_pool)
         self.loading_thread.start()
 
+        self.watchers = {}
+        self.geometry_profiles = load_geometry_profiles()
+        # headers are scanned off the GUI thread, the catalog database is only created once a catalog is opened
+        self.catalog_queue = Queue()
+        self.catalog_thread = CatalogScanThread(self, request_queue=self.catalog_queue)
+        self.catalog_thread.catalog_ready.connect(self._catalog_ready_handler)
+        self.catalog_thread.start()
+
         self.saving_queue = Queue()
-        self.saving_thread = ImageSaverThread(self, image_queue=self.saving_queue, images=self.images)
+        self.saving_thread = ImageSaverThread(self, image_queue=self.saving_queue, images=self.images,
+                                              workers=self.parameters.saver_workers)
         self.saving_thread.start()
 
         input_handling_functions = self._input_handling_functions()
@@ -110,6 +123,11 @@ class Main(QMainWindow, Ui_MainWindow):
             self.cb_save_c.addItem(f"Save all in C [{f}]")
             self.cb_save_d.addItem(f"Save all calculated [{f}]")
             self.cb_save_current.addItem(f"Save current image [{f}]")
+        for f in supportedStackFormats:
+            self.cb_save_a.addItem(f"Save A as one stack [{f}]")
+            self.cb_save_b.addItem(f"Save B as one stack [{f}]")
+            self.cb_save_c.addItem(f"Save C as one stack [{f}]")
+            self.cb_save_d.addItem(f"Save calculated as one stack [{f}]")
 
         for r in limits_dict.values():
             self.cb_auto_range.addItem(r)
@@ -184,7 +202,10 @@ class Main(QMainWindow, Ui_MainWindow):
             # Other
             self.loading_thread.image_loaded: self._image_loader_handler,
             self.loading_thread.last_image: self._last_image_handler,
+            self.loading_thread.throughput: self._loader_throughput_handler,
+            self.loading_thread.cache_stats: self._loader_cache_handler,
             self.saving_thread.image_saved: self._image_saver_handler,
+            self.saving_thread.save_failed: self._save_failed_handler,
             self.saving_thread.delete_signal: self._remove_handler,
             self.canvas_main.selection_changed: self._selection_changed,
             self.canvas_main.pixel_selected: self.plot_histogram,
@@ -212,6 +233,11 @@ class Main(QMainWindow, Ui_MainWindow):
         self.a_Batch_Processing.triggered.connect(self._batch_processing)
         self.a_Load_Images.triggered.connect(self._a_load_images_handler)
         self.a_Save_Image.triggered.connect(self._a_save_image_handler)
+        self.a_Materialize.triggered.connect(self._a_materialize_handler)
+        self.a_Watch_Folder.triggered.connect(self._a_watch_folder_handler)
+        self.a_Stop_Watching.triggered.connect(self._stop_watching)
+        self.a_Open_Catalog.triggered.connect(self._a_open_catalog_handler)
+        self.a_Open_Zarr.triggered.connect(self._a_open_zarr_handler)
 
     def _set_input_parameters(self):
         dialog = FileInfoDialog(self, self.parameters, ftype="bin")
@@ -228,6 +254,94 @@ class Main(QMainWindow, Ui_MainWindow):
             self.parameters.dtype = dialog.result["dtype"]
             self.parameters.show_axes = dialog.result["show_axes"]
             self.parameters.ratio = dialog.result["ratio"]
+            self.parameters.loader_workers = dialog.result["loader_workers"]
+            self.parameters.loader_pool = dialog.result["loader_pool"]
+            self.loading_thread.workers = self.parameters.loader_workers
+            self.loading_thread.pool = self.parameters.loader_pool
+            self.parameters.saver_workers = dialog.result["saver_workers"]
+            self.saving_thread.workers = self.parameters.saver_workers
+            self.parameters.tiff_compression = dialog.result["tiff_compression"]
+            self.parameters.tiff_tiled = dialog.result["tiff_tiled"]
+            self.parameters.memory_budget = dialog.result["memory_budget"]
+            self.images.budget = self.parameters.memory_budget * 2 ** 20
+            self.parameters.memory_codec = dialog.result["memory_codec"]
+            self.images.codec = self.parameters.memory_codec
+            self.images.enforce(keep=None if self.curr_image is None else self.curr_image.id_)
+            self._update_memory_status()
+            self.parameters.memmap = dialog.result["memmap"]
+            self.parameters.watch_order = dialog.result["watch_order"]
+            self.parameters.cache = dialog.result["cache"]
+            self.parameters.cache_size = dialog.result["cache_size"]
+            self.parameters.catalog_order = dialog.result["catalog_order"]
+
+    def _a_materialize_handler(self):
+        if self.curr_image is None or not self.curr_image.is_mapped():
+            return
+        self.curr_image.materialize()
+        self.log(f"Image {self.curr_image.id_} loaded into memory ({self.curr_image.raw.nbytes / 2 ** 20:.1f} MB).")
+
+    def _a_watch_folder_handler(self):
+        directory = QFileDialog.getExistingDirectory(self, "Watch folder", self.parameters.last_dir)
+        if directory == "":
+            return
+        dialog = LoadImagesDialog(self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        slot = dialog.result
+        self._stop_watching(slot)
+        watcher = FolderWatcherThread(self, directory=directory, slot=slot, order=self.parameters.watch_order)
+        watcher.files_ready.connect(self._watched_files_handler)
+        self.watchers[slot] = watcher
+        watcher.start()
+        polling = "" if watcher.notifications else " (polling only)"
+        self.log(f"Watching \"{directory}\" for new images in slot: {slot.upper()}{polling}.", LogTypes.Log)
+
+    def _stop_watching(self, slot=None):
+        for s in [slot] if isinstance(slot, str) else list(self.watchers.keys()):
+            watcher = self.watchers.pop(s, None)
+            if watcher is None:
+                continue
+            watcher.requestInterruption()
+            watcher.wake()
+            watcher.wait()
+            self.log(f"Stopped watching \"{watcher.directory}\".", LogTypes.Log)
+
+    def _watched_files_handler(self, filepaths, slot):
+        if slot in self.watchers:
+            self.open_files(filepaths, slot)
+
+    def _a_open_catalog_handler(self):
+        directory = QFileDialog.getExistingDirectory(self, "Open raw folder", self.parameters.last_dir)
+        if directory == "":
+            return
+        dialog = LoadImagesDialog(self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        self.open_catalog(directory, dialog.result, self.parameters.catalog_order)
+
+    def _a_open_zarr_handler(self):
+        # Zarr arrays are directories, so they can not be picked in the file dialog of Load images
+        directory = QFileDialog.getExistingDirectory(self, "Open Zarr array", self.parameters.last_dir)
+        if directory == "":
+            return
+        dialog = LoadImagesDialog(self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        self.open_files([directory], dialog.result)
+
+    def open_catalog(self, directory, slot, order_by="Meas.nProjectionNo", where="", parameters=()):
+        self.log(f"Scanning the headers of \"{directory}\"...", LogTypes.Log)
+        self.catalog_queue.put((directory, slot, order_by, where, parameters))
+        self.catalog_thread.wake()
+
+    def _catalog_ready_handler(self, event):
+        filepaths, slot, directory, updated, order_by = event
+        if filepaths is None:
+            self.log(f"Header catalog of \"{directory}\" failed: {updated}", LogTypes.Error)
+            return
+        self.log(f"Header catalog of \"{directory}\": {updated} headers updated, {len(filepaths)} files "
+                 f"opened sorted by {order_by}.", LogTypes.Log)
+        self.open_files(filepaths, slot)
 
     def _batch_processing(self):
         dialog = BatchDialog(self, self.parameters)
@@ -251,10 +365,8 @@ class Main(QMainWindow, Ui_MainWindow):
         self.last_action_ = "m"
         if self.curr_image is None:
             return
-        arr = self.curr_image.array
-        if self.parameters.from_zoom:
-            arr = self._arr_from_zoom()
-        arr_diff = arr.max() - arr.min()
+        stats = image_stats(self.curr_image, self.parameters.from_zoom)
+        arr_diff = stats.range
         slider = self.sender().objectName().split('_')[-1]
         value = self.sender().value()
 
@@ -262,12 +374,12 @@ class Main(QMainWindow, Ui_MainWindow):
             if value <= self.sliders["lower"].value():
                 self.sender().setValue(self.sliders["lower"].value() + 1)
                 return
-            self.curr_image.vmax = value * arr_diff / 100 + arr.min()
+            self.curr_image.vmax = value * arr_diff / 100 + stats.min
         elif slider == "lower":
             if value >= self.sliders["upper"].value():
                 self.sender().setValue(self.sliders["upper"].value() - 1)
                 return
-            self.curr_image.vmin = value * arr_diff / 100 + arr.min()
+            self.curr_image.vmin = value * arr_diff / 100 + stats.min
 
         self.spin_boxes[slider].blockSignals(True)
         self.spin_boxes[slider].setValue(value * arr_diff / 100)
@@ -281,15 +393,13 @@ class Main(QMainWindow, Ui_MainWindow):
         self.last_action_ = "m"
         if self.curr_image is None:
             return
-        arr = self.curr_image.array
-        if self.parameters.from_zoom:
-            arr = self._arr_from_zoom()
+        stats = image_stats(self.curr_image, self.parameters.from_zoom)
         if spin_box == "upper":
             self.curr_image.vmax = value
         elif spin_box == 'lower':
             self.curr_image.vmin = value
         self.sliders[spin_box].blockSignals(True)
-        self.sliders[spin_box].setValue(int(100 * value / (arr.max() - arr.min())))
+        self.sliders[spin_box].setValue(int(100 * value / stats.range))
         self.sliders[spin_box].blockSignals(False)
         self.canvas_main.redraw()
         self.plot_histogram()
@@ -298,17 +408,12 @@ class Main(QMainWindow, Ui_MainWindow):
         if self.curr_image is None:
             return
         self.last_action_ = "a"
-        if self.parameters.from_zoom:
-            arr = self._arr_from_zoom()
-        else:
-            arr = self.curr_image.array
-
         idx = self.cb_auto_range.currentIndex()
-        self.curr_image.vmin, self.curr_image.vmax = limits(arr, idx)
+        self.curr_image.vmin, self.curr_image.vmax = image_stats(self.curr_image, self.parameters.from_zoom).limits(idx)
 
         for el in [self.sliders['upper'], self.sliders['lower'], self.dsb_lower, self.dsb_upper]:
             el.blockSignals(True)
-        arr_diff = self.curr_image.array.max() - self.curr_image.array.min()
+        arr_diff = image_stats(self.curr_image).range
         self.sliders['lower'].setValue(int(100 * self.curr_image.vmin / arr_diff))
         self.sliders['upper'].setValue(int(100 * self.curr_image.vmax / arr_diff))
         self.dsb_lower.setValue(self.curr_image.vmin)
@@ -334,7 +439,7 @@ class Main(QMainWindow, Ui_MainWindow):
                     img.vmax = self.curr_image.vmax
                     img.vmin = self.curr_image.vmin
                 elif self.last_action_ == "a":
-                    img.vmin, img.vmax = limits(img.array, self.cb_auto_range.currentIndex())
+                    img.vmin, img.vmax = image_stats(img).limits(self.cb_auto_range.currentIndex())
                 else:
                     pass
         if pb == 'rot':
@@ -342,6 +447,7 @@ class Main(QMainWindow, Ui_MainWindow):
                 self.images[img].rotation = self.curr_image.rotation
                 self.images[img].mirror_UD = self.curr_image.mirror_UD
                 self.images[img].mirror_LR = self.curr_image.mirror_LR
+                self.images[img].orientation = self.curr_image.orientation
 
     def _sb_rows_handler(self):
         self.curr_image.y_lim = (self.sb_rows_to.value(), self.sb_rows_from.value())
@@ -354,9 +460,9 @@ class Main(QMainWindow, Ui_MainWindow):
     def _un_zoom(self):
         if self.curr_image is None:
             return
-        arr = self.curr_image.array
-        self.curr_image.x_lim = (0, arr.shape[1])
-        self.curr_image.y_lim = (arr.shape[0], 0)
+        shape = self.curr_image.shape
+        self.curr_image.x_lim = (0, shape[1])
+        self.curr_image.y_lim = (shape[0], 0)
         self.canvas_main.redraw()
         self.plot_histogram()
         self._init_image_info_values()
@@ -378,20 +484,22 @@ class Main(QMainWindow, Ui_MainWindow):
         else:
             old_rotation = self.curr_image.rotation
             index = self.cb_rotation.currentIndex()
-            self.curr_image.array = np.rot90(self.curr_image.array, (index - old_rotation) % 4)
+            self.curr_image.reorient(turns=index - old_rotation)
             self.curr_image.rotation = index
             self.canvas_main.redraw()
 
     def _mirror_handler(self, event):
+        if self.curr_image is None:
+            return
         sender = self.sender().objectName().split("_")[-1]
         if sender == "ud":
-            self.curr_image.array = np.flipud(self.curr_image.array)
+            self.curr_image.reorient(flip_ud=True)
             if event == 0:
                 self.curr_image.mirror_UD = False
             elif event == 2:
                 self.curr_image.mirror_UD = True
         elif sender == "lr":
-            self.curr_image.array = np.fliplr(self.curr_image.array)
+            self.curr_image.reorient(flip_lr=True)
             if event == 0:
                 self.curr_image.mirror_LR = False
             elif event == 2:
@@ -420,7 +528,7 @@ class Main(QMainWindow, Ui_MainWindow):
         self.open_files(filenames, group)
 
     def _a_save_image_handler(self):
-        dialog = SaveImagesDialog(self, self.models, self.saving_queue)
+        dialog = SaveImagesDialog(self, self.models, self.saving_queue, self.parameters)
         if dialog.exec_():
             self.saving_thread.wake()
 
@@ -434,25 +542,53 @@ class Main(QMainWindow, Ui_MainWindow):
                 self.combo_boxes[model].set_custom_model(model_new)
 
     def open_files(self, filepaths: list, group: str):
+        unresolved = []
+        ambiguous = []
+        assumed = {}
         for filepath in filepaths:
-            valid = False
-            while not valid:
-                valid = validate_input(filepath, self.parameters)
-                if valid is None or valid:
-                    break
-                dialog = FileInfoDialog(self, self.parameters, ftype=filepath.split(".")[-1])
-                if dialog.exec_() == QDialog.Accepted:
-                    self.parameters.width = dialog.result["width"]
-                    self.parameters.height = dialog.result["height"]
-                    self.parameters.dtype = dialog.result["dtype"]
-                    self.parameters.header = dialog.result["header"]
-                else:
-                    valid = None
-                    break
+            valid = validate_input(filepath, self.parameters)
             if valid is None:
                 self.log(f"File \"{filepath}\" could not be loaded.", LogTypes.Error)
-            else:
+            elif valid:
                 self.loading_queue.put((filepath, self.parameters, group))
+            else:
+                geometries = infer_geometry(filepath, self.geometry_profiles)
+                if len(geometries) != 1:
+                    (ambiguous if geometries else unresolved).append((filepath, geometries))
+                    continue
+                geometry = geometries[0]
+                key = (geometry["dtype"], geometry["width"], geometry["height"], geometry["header"])
+                assumed[key] = assumed.get(key, 0) + 1
+                self.loading_queue.put((filepath, replace(self.parameters, **geometry), group))
+
+        for (dtype, width, height, header), count in assumed.items():
+            self.log(f"Assumed {width}x{height} {dtype} with {header} B header for {count} files.", LogTypes.Log)
+
+        # the geometry that could not be inferred is asked for only once for the whole batch, the sizes fitting
+        # more geometries are asked for too, with the most likely geometry preselected
+        parameters = self.parameters
+        if ambiguous:
+            filepath, geometries = ambiguous[0]
+            options = ", ".join(f"{g['width']}x{g['height']} {g['dtype']}" for g in geometries)
+            self.log(f"Size of \"{filepath}\" fits {options}.", LogTypes.Warning)
+            parameters = replace(self.parameters, **geometries[0])
+        unresolved = [filepath for filepath, _ in ambiguous + unresolved]
+        if unresolved:
+            dialog = FileInfoDialog(self, parameters, ftype=unresolved[0].split(".")[-1])
+            if dialog.exec_() == QDialog.Accepted:
+                self.parameters.width = dialog.result["width"]
+                self.parameters.height = dialog.result["height"]
+                self.parameters.dtype = dialog.result["dtype"]
+                self.parameters.header = dialog.result["header"]
+                for directory in {os.path.dirname(filepath) for filepath in unresolved}:
+                    self.geometry_profiles[directory] = {key: dialog.result[key]
+                                                         for key in ["dtype", "width", "height", "header"]}
+                save_geometry_profiles(self.geometry_profiles)
+            for filepath in unresolved:
+                if dialog.result is not None and validate_input(filepath, self.parameters):
+                    self.loading_queue.put((filepath, self.parameters, group))
+                else:
+                    self.log(f"File \"{filepath}\" could not be loaded.", LogTypes.Error)
 
         self.statusbar.start_progress(self.loading_queue.qsize())
         self.loading_thread.wake()
@@ -461,24 +597,40 @@ class Main(QMainWindow, Ui_MainWindow):
         if self.curr_image is None:
             return
         combo = self.sender().objectName().split("_")[-1]
-        ftype = self.sender().currentText().split("[")[-1][:3]
+        ftype = self.sender().currentText().split("[")[-1][:-1]
 
         if ftype in ["jpg", "png"]:
             kwargs = {"dtype": "uint8"}
         else:
             kwargs = {"dtype": "uint16"}
 
+        if ftype == "tif":
+            kwargs["compression"] = self.parameters.tiff_compression
+            kwargs["tiled"] = self.parameters.tiff_tiled
+
         # if ftype == 'raw':
         #     kwargs['header'] = header
 
-        if combo == "current":
+        if "stack" in self.sender().currentText():
+            file_path, _ = QFileDialog.getSaveFileName(self, f"Save {combo} as one stack", "",
+                                                       save_formats_strings[ftype], )
+            if file_path != "":
+                kwargs["name"] = os.path.splitext(file_path.split("/")[-1])[0]
+                file_path = "/".join(file_path.split("/")[:-1])
+                combo = self.combo_boxes[combo]
+                im_ids = [combo.get_custom_item(i).data(Qt.UserRole, ) for i in range(combo.count())]
+                if im_ids:
+                    self.saving_queue.put((im_ids, ftype, file_path, kwargs))
+                    self._save_images()
+        elif combo == "current":
             file_path, _ = QFileDialog.getSaveFileName(self, "Save images", "",
                                                        save_formats_strings[ftype], )
             if file_path != "":
-                arr = self.curr_image.array
-                name = file_path.split("/")[-1][:-4]
+                # written by the saver thread, the GUI stays responsive while large images are encoded
+                kwargs["name"] = os.path.splitext(file_path.split("/")[-1])[0]
                 file_path = "/".join(file_path.split("/")[:-1])
-                get_save_image(ftype)(arr, name, file_path, **kwargs)
+                self.saving_queue.put((self.curr_image.id_, ftype, file_path, kwargs))
+                self._save_images()
         else:
             file_path = QFileDialog.getExistingDirectory(self, f"Save images from {combo}", "")
             if file_path != "":
@@ -537,8 +689,10 @@ class Main(QMainWindow, Ui_MainWindow):
         item.setData(im_id, Qt.UserRole)
         combo.add_item(item)
 
-        self.images[im_id] = ImageObject(image, image.min(), image.max(), (0, image.shape[1]),
-                                         (image.shape[0], 0), im_id, tooltip)
+        img = ImageObject(image, None, None, (0, image.shape[1]), (image.shape[0], 0), im_id, tooltip)
+        stats = image_stats(img)
+        img.vmin, img.vmax = stats.min, stats.max
+        self.images[im_id] = img
 
         slider.setMaximum(combo.count() - 1)
         slider.blockSignals(True)
@@ -548,22 +702,30 @@ class Main(QMainWindow, Ui_MainWindow):
         self.show_image(im_id)
 
     def _image_loader_handler(self, event):
-        arr, filepath, slot = event
-        if arr is not None:
+        frames, filepath, slot = event
+        if frames is not None:
             self.sliders[slot].blockSignals(True)
             self.combo_boxes[slot].blockSignals(True)
-            im_id = next(self.id_gen)
-            img = ImageObject(arr, arr.min(), arr.max(), (0, arr.shape[1]), (arr.shape[0], 0), im_id, filepath)
-            self.images[im_id] = img
-            self.last_image_id = im_id
-
-            item = QStandardItem()
-            item.setText(filepath.split("/")[-1])
-            item.setToolTip(filepath)
-            item.setData(im_id, Qt.UserRole)
-            self.models[slot].appendRow(item)
-
-            self.log(f"File \"{filepath}\" loaded with ID: {im_id} in slot: {slot.upper()}.", LogTypes.Log)
+            for i, frame in enumerate(frames):
+                im_id = next(self.id_gen)
+                img = ImageObject(frame, None, None, (0, frame.shape[1]), (frame.shape[0], 0), im_id, filepath)
+                if img.loaded and not file_mapped(frame):  # memmaps get their limits when first shown
+                    stats = image_stats(img)
+                    img.vmin, img.vmax = stats.min, stats.max
+                self.images[im_id] = img
+                self.last_image_id = im_id
+
+                item = QStandardItem()
+                item.setText(filepath.split("/")[-1] if len(frames) == 1 else f"{filepath.split('/')[-1]} [{i}]")
+                item.setToolTip(filepath)
+                item.setData(im_id, Qt.UserRole)
+                self.models[slot].appendRow(item)
+
+            if len(frames) == 1:
+                self.log(f"File \"{filepath}\" loaded with ID: {im_id} in slot: {slot.upper()}.", LogTypes.Log)
+            else:
+                self.log(f"File \"{filepath}\" opened as {len(frames)} frames with IDs: {im_id - len(frames) + 1}"
+                         f" - {im_id} in slot: {slot.upper()}.", LogTypes.Log)
             self.sliders[slot].setMaximum(self.combo_boxes[slot].count() - 1)
             self.sliders[slot].blockSignals(False)
             self.combo_boxes[slot].blockSignals(False)
@@ -573,12 +735,30 @@ class Main(QMainWindow, Ui_MainWindow):
         self.statusbar.add_progress()
 
     def _last_image_handler(self, *args):
+        for slot in self.watchers:  # watched slots follow the newest frame
+            self.sliders[slot].blockSignals(True)
+            self.combo_boxes[slot].blockSignals(True)
+            self.sliders[slot].setValue(self.sliders[slot].maximum())
+            self.combo_boxes[slot].setCurrentIndex(self.combo_boxes[slot].count() - 1)
+            self.sliders[slot].blockSignals(False)
+            self.combo_boxes[slot].blockSignals(False)
         self.show_image(self.last_image_id)
 
+    def _loader_throughput_handler(self, files, files_per_s, mb_per_s):
+        self.log(f"Loaded {files} files at {files_per_s:.1f} files/s, {mb_per_s:.1f} MB/s.", LogTypes.Log)
+
+    def _loader_cache_handler(self, hits, misses):
+        self.log(f"Image cache: {hits} hits, {misses} misses ({100 * hits / (hits + misses):.0f}% hit rate).",
+                 LogTypes.Log)
+
     def _image_saver_handler(self, file):
         self.log(f"Saved \"{file}\"")
         self.statusbar.add_progress()
 
+    def _save_failed_handler(self, file, error):
+        self.log(f"File \"{file}\" could not be saved.\n{error}", LogTypes.Error)
+        self.statusbar.add_progress()
+
     def _remove_handler(self, im_id):
         if im_id not in self.images.keys():
             return
@@ -586,6 +766,7 @@ class Main(QMainWindow, Ui_MainWindow):
             self.canvas_main.reset_canvas()
             self.canvas_histogram.reset_canvas()
         self.images.pop(im_id)
+        self._update_memory_status()
 
     def _item_changed(self, *im_id):
         slot = self.sender().objectName().split("_")[-1]
@@ -620,10 +801,11 @@ class Main(QMainWindow, Ui_MainWindow):
         self.spin_boxes['columns_to'].setRange(0, self.curr_image.x_lim[1])
         self.spin_boxes['columns_to'].setValue(self.curr_image.x_lim[1])
 
-        self.l_im_mean.setText(str(self.curr_image.array.mean()))
-        self.l_im_sigma.setText(str(self.curr_image.array.std()))
-        self.l_range_mean.setText(str(self._arr_from_zoom().mean()))
-        self.l_range_sigma.setText(str(self._arr_from_zoom().std()))
+        stats, zoom_stats = image_stats(self.curr_image), image_stats(self.curr_image, zoom=True)
+        self.l_im_mean.setText(str(stats.mean))
+        self.l_im_sigma.setText(str(stats.std))
+        self.l_range_mean.setText(str(zoom_stats.mean))
+        self.l_range_sigma.setText(str(zoom_stats.std))
 
         for sb in self.spin_boxes.values():
             sb.blockSignals(False)
@@ -632,9 +814,9 @@ class Main(QMainWindow, Ui_MainWindow):
 
     def _selection_changed(self):
         if self.parameters.from_zoom:
-            arr = self._arr_from_zoom()
-            self.curr_image.vmin = arr.min()
-            self.curr_image.vmax = arr.max()
+            stats = image_stats(self.curr_image, zoom=True)
+            self.curr_image.vmin = stats.min
+            self.curr_image.vmax = stats.max
         self._init_image_info_values()
         self.canvas_main.redraw()
         self.plot_histogram()
@@ -666,15 +848,37 @@ class Main(QMainWindow, Ui_MainWindow):
     def show_image(self, im_id):
         image = self.images[im_id]
         self.curr_image = image
+        self.images.touch(im_id)
         self.cb_auto_range.setCurrentIndex(0)
+        # the orientation widgets follow the image, so that their changes are relative to its own orientation
+        for el in [self.cb_rotation, self.cb_mirror_ud, self.cb_mirror_lr]:
+            el.blockSignals(True)
+        self.cb_rotation.setCurrentIndex(image.rotation)
+        self.cb_mirror_ud.setChecked(image.mirror_UD)
+        self.cb_mirror_lr.setChecked(image.mirror_LR)
+        for el in [self.cb_rotation, self.cb_mirror_ud, self.cb_mirror_lr]:
+            el.blockSignals(False)
 
-        if self.parameters.from_zoom:
-            arr = self._arr_from_zoom()
-            self.curr_image.vmin = arr.min()
-            self.curr_image.vmax = arr.max()
+        if self.parameters.from_zoom or image.vmin is None:
+            stats = image_stats(image, self.parameters.from_zoom)
+            self.curr_image.vmin = stats.min
+            self.curr_image.vmax = stats.max
         self.canvas_main.show_image(image)
         self.plot_histogram()
         self._init_image_info_values()
+        self._update_memory_status()
+
+    def _update_memory_status(self):
+        # resident arrays count against the memory budget, spilled ones are memory-mapped scratch files
+        texts, tooltips = [], []
+        for slot, model in self.models.items():
+            im_ids = [model.item(row).data(Qt.UserRole) for row in range(model.rowCount())]
+            resident, compressed, spilled = self.images.usage(im_ids)
+            texts.append(f"{slot.upper()}: {resident / 2 ** 20:.0f} MB")
+            tooltips.append(f"{slot.upper()}: {resident / 2 ** 20:.1f} MB in memory "
+                            f"({compressed / 2 ** 20:.1f} MB compressed), {spilled / 2 ** 20:.1f} MB spilled to disk")
+        budget = f" / {self.images.budget / 2 ** 20:.0f} MB" if self.images.budget else ""
+        self.statusbar.show_memory("  ".join(texts) + budget, "\n".join(tooltips))
 
     def log(self, text, log_type=LogTypes.Log):
         if log_type == LogTypes.Log:
@@ -686,8 +890,7 @@ class Main(QMainWindow, Ui_MainWindow):
         self.log_widget.append(text)
 
     def _arr_from_zoom(self):
-        return self.curr_image.array[self.curr_image.y_lim[1]:self.curr_image.y_lim[0],
-               self.curr_image.x_lim[0]:self.curr_image.x_lim[1]]
+        return self.curr_image.zoomed()
 
     def resizeEvent(self, event):
         self.gb_fig_settings.setFixedWidth(int(event.size().width() / 6))
@@ -701,6 +904,11 @@ class Main(QMainWindow, Ui_MainWindow):
         self.loading_thread.wake()
         self.saving_thread.requestInterruption()
         self.saving_thread.wake()
+        self._stop_watching()
+        self.catalog_thread.requestInterruption()
+        self.catalog_thread.wake()
+        TiffPageFrame.close_all()
+        self.images.close()
         if self.dm_thread:
             self.dm_thread.requestInterruption()
             self.dm_thread.wake()
@@ -0,0 +1,33 @@
+import os
+
+from utils.utils import infer_geometry
+
+
+def write_file(directory, size):
+    path = os.path.join(directory, "frame.bin")
+    with open(path, 'wb') as f:
+        f.write(b"\0" * size)
+    return path
+
+
+def test_unique_size(tmp_path):
+    assert infer_geometry(write_file(tmp_path, 300 * 300 * 2), {}) == \
+        [{"dtype": "uint16", "width": 300, "height": 300, "header": 0}]
+
+
+def test_ambiguous_size(tmp_path):
+    # 1024x2048 uint16 and 1024x1024 float32 frames have the same size
+    geometries = infer_geometry(write_file(tmp_path, 1024 * 1024 * 4), {})
+    assert len(geometries) > 1
+    assert geometries[0] == {"dtype": "uint16", "width": 1024, "height": 2048, "header": 0}
+    assert {"dtype": "float32", "width": 1024, "height": 1024, "header": 0} in geometries
+
+
+def test_profile_resolves_ambiguity(tmp_path):
+    path = write_file(tmp_path, 1024 * 1024 * 4)
+    profile = {"dtype": "float32", "width": 1024, "height": 1024, "header": 0}
+    assert infer_geometry(path, {os.path.dirname(path): profile}) == [profile]
+
+
+def test_unknown_size(tmp_path):
+    assert infer_geometry(write_file(tmp_path, 12345), {}) == []
@@ -0,0 +1,16 @@
+import numpy as np
+
+from utils.EZRT import Header, RawStackWriter, loadFrames
+
+
+def test_reused_buffer(tmp_path):
+    path = str(tmp_path / "stack.raw")
+    buffer = np.empty((64, 80), np.uint16)
+    with RawStackWriter(path, Header(), buffer.shape, buffer.dtype, amount=20, bufferFrames=8) as writer:
+        for i in range(20):
+            buffer[:] = i  # the frame is filled again while earlier ones may still wait for the disk
+            writer.write(buffer)
+    header, frames = loadFrames(path)
+    assert header.Image.siAmount == 20
+    for i, frame in enumerate(frames):
+        assert np.all(frame.read() == i)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from utils.ZarrStore import ZarrStore, ZarrWriter
+
+
+def write_stack(path, frames, chunks=None):
+    with ZarrWriter(path, frames[0].shape, frames[0].dtype, len(frames), chunks=chunks) as writer:
+        for frame in frames:
+            writer.write(frame)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "stack.zarr")
+    frames = [np.random.default_rng(i).integers(0, 4000, (100, 130)).astype(np.uint16) for i in range(5)]
+    write_stack(path, frames, chunks=(2, 32, 48))
+    store = ZarrStore(path)
+    for frame, stored in zip(frames, store.frames()):
+        assert np.array_equal(stored.read(), frame)
+        assert np.array_equal(stored.region(5, 90, 7, 129, 3), frame[5:90:3, 7:129:3])
+
+
+def test_rewrite_is_not_read_from_cache(tmp_path):
+    path = str(tmp_path / "stack.zarr")
+    write_stack(path, [np.full((100, 130), i, np.uint16) for i in range(4)], chunks=(2, 32, 48))
+    assert ZarrStore(path).frames()[1].read()[0, 0] == 1  # the chunks are cached now
+
+    # the same data with different values and chunks written again to the same path
+    frames = [np.full((100, 130), 10 + i, np.uint16) for i in range(3)]
+    write_stack(path, frames, chunks=(3, 50, 50))
+    store = ZarrStore(path)
+    assert store.chunks == (3, 50, 50)
+    for frame, stored in zip(frames, store.frames()):
+        assert np.array_equal(stored.read(), frame)
@@ -1,4 +1,4 @@
-from PyQt5.QtWidgets import QStatusBar, QProgressBar
+from PyQt5.QtWidgets import QStatusBar, QProgressBar, QLabel
 
 
 class CustomStatusBar(QStatusBar):
@@ -8,6 +8,12 @@ class CustomStatusBar(QStatusBar):
         self.addPermanentWidget(self.progress_bar, 0)
         self.progress_bar.setMaximum(0)
         self.progress_bar.setVisible(False)
+        self.memory_label = QLabel(self)
+        self.addPermanentWidget(self.memory_label, 0)
+
+    def show_memory(self, text, tooltip=""):
+        self.memory_label.setText(text)
+        self.memory_label.setToolTip(tooltip)
 
     def start_progress(self, steps):
         self.progress_bar.setVisible(True)
@@ -41,6 +41,9 @@ class MPLBetterCanvas(QWidget):
         # Image showing
         self.params = None
         self.image = None
+        self.arr = None
+        self.offset = (0, 0)
+        self.step = 1
         self.cbar = None
         self.points = []
         self.plot_profile_window = None
@@ -50,8 +53,19 @@ class MPLBetterCanvas(QWidget):
             return
         self.fig.delaxes(self.ax)
         self.ax = self.fig.add_axes((0, 0, 1, 1))
-        arr = self.image.array
-        self.im = self.ax.imshow(arr, cmap=self.params.cmap, vmin=self.image.vmin, vmax=self.image.vmax)
+        arr = self.image.visible()
+        extent = None
+        self.offset = (0, 0)
+        self.step = self.image.view_step()
+        if arr.shape != self.image.shape:  # only the zoomed region of a large lazy page was read, maybe decimated
+            y0, x0 = max(0, min(self.image.y_lim)), max(0, min(self.image.x_lim))
+            y0, x0 = int(y0 + .5), int(x0 + .5)
+            h, w = arr.shape[0] * self.step, arr.shape[1] * self.step
+            extent = (x0 - .5, x0 + w - .5, y0 + h - .5, y0 - .5)
+            self.offset = (y0, x0)
+        self.arr = arr
+        self.im = self.ax.imshow(arr, cmap=self.params.cmap, vmin=self.image.vmin, vmax=self.image.vmax,
+                                 extent=extent)
 
         self.ax.get_xaxis().set_visible(self.params.show_axes)
         self.ax.get_yaxis().set_visible(self.params.show_axes)
@@ -66,7 +80,7 @@ class MPLBetterCanvas(QWidget):
         self.image = image
         filename = image.filepath.split("/")[-1]
         self.params = self.window().parameters
-        self.parent().setTitle(f"Image: {filename} [{image.array.shape[0]}x{image.array.shape[1]}]")
+        self.parent().setTitle(f"Image: {filename} [{image.shape[0]}x{image.shape[1]}]")
         self._imshow()
 
     def redraw(self):
@@ -99,10 +113,10 @@ class MPLBetterCanvas(QWidget):
         if event.inaxes and self.image is not None:
             x, y = event.xdata, event.ydata
 
-            if x >= self.image.array.shape[1] or y >= self.image.array.shape[0]:
+            if x >= self.image.shape[1] or y >= self.image.shape[0]:
                 return
             try:
-                value = self.image.array[int(y + .5)][int(x + .5)]
+                value = self.pixel_value(x, y)
             except IndexError:
                 value = 0
             self.label.setText(f"row:{y:.0f}, col:{x:.0f} value:{value:.2f}")
@@ -125,18 +139,18 @@ class MPLBetterCanvas(QWidget):
             return
         if event.button == 1:  # left click
             if event.dblclick:
-                self.image.x_lim = 0, self.image.array.shape[1]
-                self.image.y_lim = self.image.array.shape[0], 0
+                self.image.x_lim = 0, self.image.shape[1]
+                self.image.y_lim = self.image.shape[0], 0
                 self.selection_changed.emit()
                 self.points = []
             else:
                 if event.inaxes:
                     x, y = event.xdata, event.ydata
 
-                    if x >= self.image.array.shape[1] or y >= self.image.array.shape[0]:
+                    if x >= self.image.shape[1] or y >= self.image.shape[0]:
                         return
                     try:
-                        value = self.image.array[int(y + .5)][int(x + .5)]
+                        value = self.pixel_value(x, y)
                     except IndexError:
                         value = float("inf")
                     if 'ctrl' in event.modifiers and "shift" not in event.modifiers:
@@ -145,6 +159,13 @@ class MPLBetterCanvas(QWidget):
                         self.remove_point(x, y)
                     self.pixel_selected.emit(value)
 
+    def pixel_value(self, x, y):
+        row = (int(y + .5) - self.offset[0]) // self.step
+        col = (int(x + .5) - self.offset[1]) // self.step
+        if row < 0 or col < 0:
+            raise IndexError
+        return self.arr[row][col]
+
     def add_point(self, x, y):
         if len(self.points) == 0:
             self.points.append((x, y))
@@ -184,9 +205,8 @@ class MPLBetterCanvas(QWidget):
             self.add_point(*p)
 
     def plot_profile(self, p0, p1):
-        interp = RegularGridInterpolator(
-            (np.arange(0, self.image.array.shape[0]), np.arange(0, self.image.array.shape[1])), self.image.array,
-            "nearest")
+        arr = self.image.array
+        interp = RegularGridInterpolator((np.arange(0, arr.shape[0]), np.arange(0, arr.shape[1])), arr, "nearest")
         p0, p1 = (p0, p1) if p0[0] < p1[0] else (p1, p0)
         line_points = bresenham_line(p0, p1)
         data = interp(line_points)
@@ -216,9 +236,9 @@ class MPLBetterCanvas(QWidget):
                 factor = event.step * 1 / np.e
                 x_lim_l = smaller(self.image.x_lim[0] + (center_x - self.image.x_lim[0]) * factor, 0)
                 x_lim_r = bigger(self.image.x_lim[1] - (self.image.x_lim[1] - center_x) * factor,
-                                 self.image.array.shape[0])
+                                 self.image.shape[0])
                 y_lim_l = bigger(self.image.y_lim[0] - (self.image.y_lim[0] - center_y) * factor,
-                                 self.image.array.shape[0])
+                                 self.image.shape[0])
                 y_lim_r = smaller(self.image.y_lim[1] + (center_y - self.image.y_lim[1]) * factor, 0)
                 if x_lim_r - x_lim_l < 5 or y_lim_l - y_lim_r < 5:
                     return
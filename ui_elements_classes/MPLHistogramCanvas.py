@@ -7,6 +7,7 @@ from matplotlib import pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 
 from utils.global_vars import LogTypes
+from utils.ImageStats import image_stats
 
 
 class MPLHistogramCanvas(QWidget):
@@ -30,8 +31,9 @@ class MPLHistogramCanvas(QWidget):
     def plot_histogram(self, image, parameters, value=None):
         self.ax.clear()
         try:
-            data = image.array.flatten()
-            counts, bins, patches = self.ax.hist(data, bins=parameters.num_bins, edgecolor='none', linewidth=1.2)
+            # the bars are drawn from the cached histogram, one weighted value per bin
+            counts, bins = image_stats(image).histogram(parameters.num_bins)
+            counts, bins, patches = self.ax.hist(bins[:-1], bins=bins, weights=counts, edgecolor='none', linewidth=1.2)
 
             try:
                 self.ax.axvline(image.vmin, color='r')
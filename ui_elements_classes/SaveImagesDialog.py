@@ -13,7 +13,7 @@ Ui_SettingsDialog, QDialog = loadUiType('./ui_elements/QtUI/SaveImagesDialog.ui'
 class SaveImagesDialog(QDialog, Ui_SettingsDialog):
     save_signal = pyqtSignal(name="save")
 
-    def __init__(self, parent=None, models=None, saving_queue=None):
+    def __init__(self, parent=None, models=None, saving_queue=None, parameters=None):
         super().__init__(parent)
         self.setupUi(self)
         self.setWindowTitle("Select images to save")
@@ -41,6 +41,10 @@ class SaveImagesDialog(QDialog, Ui_SettingsDialog):
 
         self.cb_ftype.addItems(supportedSaveFormats)
         self.cb_dtype.addItems(supportedDataTypesByFileType[self.cb_ftype.currentText()])
+        self.cb_compression.addItems(tiff_compressions)
+        if parameters is not None:
+            self.cb_compression.setCurrentText(parameters.tiff_compression)
+            self.cb_tiled.setChecked(parameters.tiff_tiled)
         self.cb_ftype.currentIndexChanged.connect(self._cb_ftype_handler)
         # self.cb_remove.clicked.connect(self._cb_remove_handler)
         self.buttonBox.clicked.connect(self.save_images)
@@ -75,18 +79,32 @@ class SaveImagesDialog(QDialog, Ui_SettingsDialog):
     def save_images(self, button):
         if self.buttonBox.buttonRole(button) == QDialogButtonBox.AcceptRole:
             kwargs = {"dtype": self.cb_dtype.currentText()}
+            if self.cb_ftype.currentText() == "tif":
+                kwargs["compression"] = self.cb_compression.currentText()
+                kwargs["tiled"] = self.cb_tiled.isChecked()
 
             if self.cb_remove.isChecked():
                 kwargs["remove"] = True
                 self.result = {key: self.models[key].model for key in self.models}
+            if self.cb_common_range.isChecked():
+                kwargs["common_range"] = [self.model.item(row).data(Qt.UserRole) for row in range(self.model.rowCount())]
+
+            ftype = self.cb_ftype.currentText()
+            filepath = self.le_output_path.text()
+            if self.cb_stack.isChecked() and ftype in supportedStackFormats:
+                im_ids = [self.model.item(row).data(Qt.UserRole) for row in range(self.model.rowCount())]
+                if im_ids:
+                    self.saving_queue.put((im_ids, ftype, filepath, kwargs))
+                return
 
             for row in range(self.model.rowCount()):
                 item = self.model.item(row)
                 im_id = item.data(Qt.UserRole)
-                ftype = self.cb_ftype.currentText()
-                filepath = self.le_output_path.text()
                 self.saving_queue.put((im_id, ftype, filepath, kwargs))
 
     def _cb_ftype_handler(self):
         self.cb_dtype.clear()
         self.cb_dtype.addItems(supportedDataTypesByFileType[self.cb_ftype.currentText()])
+        self.cb_compression.setEnabled(self.cb_ftype.currentText() == "tif")
+        self.cb_tiled.setEnabled(self.cb_ftype.currentText() == "tif")
+        self.cb_stack.setEnabled(self.cb_ftype.currentText() in supportedStackFormats)
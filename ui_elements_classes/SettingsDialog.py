@@ -1,6 +1,9 @@
 from PyQt5.uic import loadUiType
 import numpy as np  # for evaluation of ratio
 from utils.global_vars import *
+from utils.FolderWatcherThread import watch_orders
+from utils.frames import memory_codecs
+from utils.HeaderCatalog import catalog_fields
 
 Ui_SettingsDialog, QDialog = loadUiType('./ui_elements/QtUI/SettingsDialog.ui')
 
@@ -12,6 +15,11 @@ class SettingsDialog(QDialog, Ui_SettingsDialog):
         self.setWindowTitle("Settings")
         self.cb_ftype.addItems(supportedLoadFormats)
         self.cb_dtype.addItems(supportedDataTypes)
+        self.cb_loader_pool.addItems(loader_pools)
+        self.cb_watch_order.addItems(watch_orders)
+        self.cb_catalog_order.addItems(catalog_fields)
+        self.cb_tiff_compression.addItems(tiff_compressions)
+        self.cb_memory_codec.addItems(["none"] + list(memory_codecs))
         self.result = None
 
         self.cb_ftype.setCurrentText(kwargs["ftype"])
@@ -19,6 +27,19 @@ class SettingsDialog(QDialog, Ui_SettingsDialog):
         self.sb_header.setValue(parameters.header)
         self.sb_width.setValue(parameters.width)
         self.sb_height.setValue(parameters.height)
+        self.sb_loader_workers.setValue(parameters.loader_workers)
+        self.cb_loader_pool.setCurrentText(parameters.loader_pool)
+        self.sb_saver_workers.setValue(parameters.saver_workers)
+        self.cb_tiff_compression.setCurrentText(parameters.tiff_compression)
+        self.cb_tiff_tiled.setChecked(parameters.tiff_tiled)
+        self.sb_memory_budget.setValue(parameters.memory_budget)
+        self.cb_memory_codec.setCurrentText(parameters.memory_codec)
+        self.cb_memmap.setChecked(parameters.memmap)
+        self.cb_watch_order.setCurrentText(parameters.watch_order)
+        self.cb_cache.setChecked(parameters.cache)
+        self.cb_cache.setToolTip(parameters.cache_dir)
+        self.sb_cache_size.setValue(parameters.cache_size)
+        self.cb_catalog_order.setCurrentText(parameters.catalog_order)
 
         self.buttonBox.accepted.connect(self.accept)
 
@@ -30,6 +51,18 @@ class SettingsDialog(QDialog, Ui_SettingsDialog):
             "height": self.sb_height.value(),
             "header": self.sb_header.value(),
             "show_axes": self.cb_show_axes.isChecked(),
-            "ratio": eval(self.le_ratio.text())
+            "ratio": eval(self.le_ratio.text()),
+            "loader_workers": self.sb_loader_workers.value(),
+            "loader_pool": self.cb_loader_pool.currentText(),
+            "saver_workers": self.sb_saver_workers.value(),
+            "tiff_compression": self.cb_tiff_compression.currentText(),
+            "tiff_tiled": self.cb_tiff_tiled.isChecked(),
+            "memory_budget": self.sb_memory_budget.value(),
+            "memory_codec": self.cb_memory_codec.currentText(),
+            "memmap": self.cb_memmap.isChecked(),
+            "watch_order": self.cb_watch_order.currentText(),
+            "cache": self.cb_cache.isChecked(),
+            "cache_size": self.sb_cache_size.value(),
+            "catalog_order": self.cb_catalog_order.currentText(),
         }
         super().accept()
@@ -0,0 +1,48 @@
+import queue
+
+from PyQt5.QtCore import pyqtSignal, QThread, QMutex, QWaitCondition
+
+from .HeaderCatalog import HeaderCatalog
+from .global_vars import header_catalog_path
+
+
+class CatalogScanThread(QThread):
+    # (filepaths, slot, directory, updated headers, order_by), or (None, slot, directory, error, order_by)
+    catalog_ready = pyqtSignal(tuple, name="catalog_ready")
+
+    def __init__(self, parent=None, request_queue: queue.Queue = None, path: str = header_catalog_path):
+        super().__init__(parent=parent)
+        self.mutex = QMutex()
+        self.condition = QWaitCondition()
+        self.request_queue = request_queue
+        self.path = path
+
+    def run(self):
+        # SQLite connections belong to the thread that opened them, the database is created on its first use only
+        catalog = None
+        self.wait_for_signal()
+        while not self.isInterruptionRequested():
+            while not self.request_queue.empty() and not self.isInterruptionRequested():
+                directory, slot, order_by, where, parameters = self.request_queue.get()
+                try:
+                    if catalog is None:
+                        catalog = HeaderCatalog(self.path)
+                    updated = catalog.scan(directory)
+                    filepaths = catalog.query(directory, order_by, where, parameters)
+                except Exception as e:
+                    self.catalog_ready.emit((None, slot, directory, str(e), order_by))
+                    continue
+                self.catalog_ready.emit((filepaths, slot, directory, updated, order_by))
+            self.wait_for_signal()
+        if catalog is not None:
+            catalog.close()
+
+    def wait_for_signal(self):
+        self.mutex.lock()
+        self.condition.wait(self.mutex)
+        self.mutex.unlock()
+
+    def wake(self):
+        self.mutex.lock()
+        self.condition.wakeAll()
+        self.mutex.unlock()
@@ -1,60 +1,146 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from struct import unpack, pack
-
-
-class Image(object):
-    pass
-
-
-class Meas(object):
+from struct import unpack
+from .frames import MemmapFrame, read_region
+
+
+# Layout of the header version 2.5.0 as (section, field, type, count), equal to Header.decodeString
+headerFields = [
+    # -------------------------------------------Image-----------------------------%
+    ("Image", "siWidth", "<i2", 1), ("Image", "siHeight", "<i2", 1), ("Image", "siDepth", "<i2", 1),
+    ("Image", "siAmount", "<i2", 1), ("Image", "siHeaderLength", "<i2", 1), ("Image", "siVerMajor", "<i2", 1),
+    ("Image", "siVerMinor", "<i2", 1), ("Image", "siVerRevision", "<i2", 1),
+    # --------------------------------------------Meas-----------------------------%
+    ("Meas", "nMeasId", "<i4", 1), ("Meas", "nFdd", "<i4", 1), ("Meas", "nFod", "<i4", 1),
+    ("Meas", "nProjectionNo", "<i4", 1), ("Meas", "nDetWidth", "<i4", 1), ("Meas", "nDetHeight", "<i4", 1),
+    ("Meas", "nPixelsH", "<i4", 1), ("Meas", "nPixelsV", "<i4", 1), ("Meas", "nMeasAreaStart", "<i4", 1),
+    ("Meas", "nRecoLineStart", "<i4", 1), ("Meas", "nRecoLineEnd", "<i4", 1), ("Meas", "fPixelWidth", "<f4", 1),
+    # 0: conventional 3D-CT, 1: Swing Laminography, 2: spiral 3D-CT (helix), 100: Objekt Z-Shift
+    ("Meas", "uiAcquisitionGeom", "<u4", 1), ("Meas", "nUnused", "<i4", 1),
+    ("Meas", "lfShiftH", "<f8", 1), ("Meas", "lfShiftV", "<f8", 1),  # in pixels
+    ("Meas", "lfTiltAngle", "<f8", 1),
+    # --------------------------------------------Doku-----------------------------%
+    ("Docu", "nVoltage", "<i4", 1), ("Docu", "nCurrent", "<i4", 1), ("Docu", "nIntegrationTime", "<i4", 1),
+    ("Docu", "nFrameAverage", "<i4", 1), ("Docu", "nSkip", "<i4", 1), ("Docu", "nZPosition", "<i4", 1),
+    ("Docu", "nYDetPos", "<i4", 1), ("Docu", "nYSamplePos", "<i4", 1), ("Docu", "cMeasName", "S288", 1),
+    ("Docu", "cDate", "S12", 1), ("Docu", "cTime", "S8", 1), ("Docu", "nBeam", "<i4", 1),
+    ("Docu", "fBeam", "<f4", 31), ("Docu", "nKeepData", "<i4", 1),
+    # --------------------------------------RekoParameter--------------------------%
+    ("RecoParam", "nXRecoNumber", "<i4", 1), ("RecoParam", "nYRecoNumber", "<i4", 1),
+    ("RecoParam", "nZRecoNumber", "<i4", 1), ("RecoParam", "fRecNorm", "<f4", 1),
+    ("RecoParam", "fVoxelX", "<f4", 1), ("RecoParam", "fVoxelZ", "<f4", 1),
+    # -------------------------------------------INull-----------------------------%
+    ("I0", "uiNull", "<u4", 1), ("I0", "siXPos", "<i2", 1), ("I0", "siYPos", "<i2", 1),
+    ("I0", "siDeltaX", "<i2", 1), ("I0", "siDeltaY", "<i2", 1), ("I0", "nAlign", "<i4", 1),
+    # -----------------------------------------SwingLam----------------------------%
+    ("LimitedAngle", "lfStartAngle", "<f8", 1), ("LimitedAngle", "lfAngleStep", "<f8", 1),
+    # -----------------------------------------DokuEx------------------------------%
+    ("DocuEx", "szPreFilter", "S32", 1), ("DocuEx", "aiReserved", "<i4", 8),
+    # ---------------------------------------RekoParamEx---------------------------%
+    ("RecoParamEx", "fRecVolMin", "<f4", 1), ("RecoParamEx", "fRecVolMax", "<f4", 1),
+    ("RecoParamEx", "fOffset", "<f4", 1), ("RecoParamEx", "nZRecoNumMax", "<i4", 1),
+    ("RecoParamEx", "nZFirstSlice", "<i4", 1), ("RecoParamEx", "nZLastSlice", "<i4", 1),
+    ("RecoParamEx", "uiCTAlgorithm", "<u4", 1), ("RecoParamEx", "eUsedCTFilter", "<u4", 1),
+    ("RecoParamEx", "eUsedCTAlgorithmPlatform", "<u4", 1), ("RecoParamEx", "eUsedCTProjectionPadding", "<u4", 1),
+    ("RecoParamEx", "fPaddingObjectRadius", "<f4", 1), ("RecoParamEx", "aiReserved", "<i4", 5),
+    # -------------------------------------------Helix-----------------------------%
+    ("Helix", "lfZShift", "<f8", 1), ("Helix", "lfScanRange", "<f8", 1),
+    ("Helix", "nProjPerZShift", "<i4", 1), ("Helix", "nAlign", "<i4", 1),
+    # -----------------------------------------ArbitGeom---------------------------%
+    ("ArbitGeom", "agvSource", "<f8", 3), ("ArbitGeom", "agvSourceDirection", "<f8", 3),
+    ("ArbitGeom", "agvDetectorCenter", "<f8", 3), ("ArbitGeom", "agvDetLineDirection", "<f8", 3),
+    ("ArbitGeom", "agvDetColumnDirection", "<f8", 3), ("ArbitGeom", "agvRecoReference", "<f8", 3),
+    ("ArbitGeom", "aaRecoOrientation", "<f8", 4),
+    # --------------------------------------Range Extension------------------------%
+    ("RangeExtension", "nRangeExtensionSizeRow", "<i4", 1), ("RangeExtension", "nRangeExtensionSizeColumn", "<i4", 1),
+    ("RangeExtension", "nMultiscan", "<i4", 1), ("RangeExtension", "nAlign", "<i4", 1),
+    # --------------------------------------------Leer-----------------------------%
+    ("Empty", "leer", "S40", 1),
+    # ------------------------------------------Platform---------------------------%
+    ("Platform", "uiEndian", "<u4", 1), ("Platform", "nReserved1", "<i4", 1), ("Platform", "uiEndi64", "<u8", 1),
+    # --------------------------------------------User-----------------------------%
+    ("User", "strUserString", "S1024", 1),
+]
+
+headerDtype = np.dtype([(f"{section}.{field}", dtype) if count == 1 else (f"{section}.{field}", dtype, (count,))
+                        for section, field, dtype, count in headerFields])
+assert headerDtype.itemsize == 2048
+
+
+class Section(object):
+    # attribute access to the fields of one section of the header record
+    def __init__(self, header, name):
+        object.__setattr__(self, "_header", header)
+        object.__setattr__(self, "_prefix", name + ".")
+
+    def __getattr__(self, name):
+        key = self._prefix + name
+        if key not in headerDtype.fields:
+            raise AttributeError(name)
+        value = self._header.record[key]
+        return value.item() if value.ndim == 0 else tuple(value.tolist())
+
+    def __setattr__(self, name, value):
+        key = self._prefix + name
+        if key not in headerDtype.fields:
+            raise AttributeError(name)
+        self._header.record[key] = value
+
+
+class Image(Section):
     pass
 
 
-class Docu(object):
+class Meas(Section):
     pass
 
 
-class DocuEx(object):
+class Docu(Section):
     pass
 
 
-class RecoParam(object):
+class DocuEx(Section):
     pass
 
 
-class RecoParamEx(object):
+class RecoParam(Section):
     pass
 
 
-class I0(object):
+class RecoParamEx(Section):
     pass
 
 
-class LimitedAngle(object):
+class I0(Section):
     pass
 
 
-class Helix(object):
+class LimitedAngle(Section):
     pass
 
 
-class ArbitGeom(object):
+class Helix(Section):
     pass
 
 
-class Empty(object):
+class ArbitGeom(Section):
     pass
 
 
-class RangeExtension(object):
+class RangeExtension(Section):
     pass
 
 
-class Platform(object):
+class Platform(Section):
     pass
 
 
-class User(object):
+class User(Section):
     pass
 
 
@@ -74,37 +160,43 @@ class Header(object):
     nLengthUserString = 1024
 
     def __init__(self, headerUnpacked=None,
-                 headerPacked=None):
+                 headerPacked=None, record=None):
         # headerPacked is the 2048 bytes as read from a binary file,
-        # headerUnpacked is a tuple containing the decoded values
-
-        self.Image = Image()
-        self.Meas = Meas()
-        self.Docu = Docu()
-        self.DocuEx = DocuEx()
-        self.RecoParam = RecoParam()
-        self.RecoParamEx = RecoParamEx()
-        self.I0 = I0()
-        self.LimitedAngle = LimitedAngle()
-        self.Helix = Helix()
-        self.ArbitGeom = ArbitGeom()
-        self.Empty = Empty()
-        self.RangeExtension = RangeExtension()
-        self.Platform = Platform()
-        self.User = User()
-
-        if headerUnpacked is None:
-            if headerPacked is None:
-                headerPacked = (np.zeros(1024, "uint16")).tostring()
-
-            rc, headerUnpacked = self.unpackHeader(headerPacked)
+        # headerUnpacked is a tuple containing the decoded values,
+        # record is a 0-d array of headerDtype, e.g. one header of readHeaders, which is used without copying
 
-        if rc == 0:
-            self.setHeader(headerUnpacked)
-            # print "header set"
+        if record is not None:
+            self.record = record
+        elif headerPacked is not None:
+            self.record = np.frombuffer(bytearray(headerPacked[:2048]), headerDtype, 1).reshape(())
         else:
+            self.record = np.zeros((), headerDtype)
+
+        self.Image = Image(self, "Image")
+        self.Meas = Meas(self, "Meas")
+        self.Docu = Docu(self, "Docu")
+        self.DocuEx = DocuEx(self, "DocuEx")
+        self.RecoParam = RecoParam(self, "RecoParam")
+        self.RecoParamEx = RecoParamEx(self, "RecoParamEx")
+        self.I0 = I0(self, "I0")
+        self.LimitedAngle = LimitedAngle(self, "LimitedAngle")
+        self.Helix = Helix(self, "Helix")
+        self.ArbitGeom = ArbitGeom(self, "ArbitGeom")
+        self.RangeExtension = RangeExtension(self, "RangeExtension")
+        self.Platform = Platform(self, "Platform")
+        self.User = User(self, "User")
+
+        if headerUnpacked is not None and self.setHeader(headerUnpacked) != 0:
             print("Instantiation of the class failed")
 
+    @property
+    def Empty(self):
+        return self.record["Empty.leer"].item()
+
+    @Empty.setter
+    def Empty(self, value):
+        self.record["Empty.leer"] = value
+
     def unpackHeader(self, headerPacked):
         try:
             headerUnpacked = unpack(Header.decodeString, headerPacked)
@@ -113,125 +205,11 @@ class Header(object):
             return (-1, None)
 
     def setHeader(self, headerUnpacked):
-        header = headerUnpacked
-
         try:
-            # -------------------------------------------Image-----------------------------%
-            self.Image.siWidth = header[0]
-            self.Image.siHeight = header[1]
-            self.Image.siDepth = header[2]
-            self.Image.siAmount = header[3]
-            self.Image.siHeaderLength = header[4]
-            self.Image.siVerMajor = header[5]
-            self.Image.siVerMinor = header[6]
-            self.Image.siVerRevision = header[7]
-
-            # --------------------------------------------Meas-----------------------------%
-            self.Meas.nMeasId = header[8]
-            self.Meas.nFdd = header[9]
-            self.Meas.nFod = header[10]
-            self.Meas.nProjectionNo = header[11]
-            self.Meas.nDetWidth = header[12]
-            self.Meas.nDetHeight = header[13]
-            self.Meas.nPixelsH = header[14]
-            self.Meas.nPixelsV = header[15]
-            self.Meas.nMeasAreaStart = header[16]
-            self.Meas.nRecoLineStart = header[17]
-            self.Meas.nRecoLineEnd = header[18]
-            self.Meas.fPixelWidth = header[19]
-            self.Meas.uiAcquisitionGeom = header[20]
-            # 0: conventional 3D-CT, 1: Swing Laminography, 2: spiral 3D-CT (helix), 100: Objekt Z-Shift
-            self.Meas.nUnused = header[21]
-            self.Meas.lfShiftH = header[22]  # in pixels
-            self.Meas.lfShiftV = header[23]  # in pixels
-            self.Meas.lfTiltAngle = header[24]
-
-            # --------------------------------------------Doku-----------------------------%
-            self.Docu.nVoltage = header[25]
-            self.Docu.nCurrent = header[26]
-            self.Docu.nIntegrationTime = header[27]
-            self.Docu.nFrameAverage = header[28]
-            self.Docu.nSkip = header[29]
-            self.Docu.nZPosition = header[30]
-            self.Docu.nYDetPos = header[31]
-            self.Docu.nYSamplePos = header[32]
-            self.Docu.cMeasName = header[33]  # .rstrip('\x00')
-            self.Docu.cDate = header[34]  # .rstrip('\x00')
-            self.Docu.cTime = header[35]  # .rstrip('\x00')
-            self.Docu.nBeam = header[36]
-            self.Docu.fBeam = header[37:68]
-            self.Docu.nKeepData = header[68]
-
-            # --------------------------------------RekoParameter--------------------------%
-            self.RecoParam.nXRecoNumber = header[69]
-            self.RecoParam.nYRecoNumber = header[70]
-            self.RecoParam.nZRecoNumber = header[71]
-            self.RecoParam.fRecNorm = header[72]
-            self.RecoParam.fVoxelX = header[73]
-            self.RecoParam.fVoxelZ = header[74]
-
-            # -------------------------------------------INull-----------------------------%
-            self.I0.uiNull = header[75]
-            self.I0.siXPos = header[76]
-            self.I0.siYPos = header[77]
-            self.I0.siDeltaX = header[78]
-            self.I0.siDeltaY = header[79]
-            self.I0.nAlign = header[80]
-
-            # -----------------------------------------SwingLam----------------------------%
-            self.LimitedAngle.lfStartAngle = header[81]
-            self.LimitedAngle.lfAngleStep = header[82]
-
-            # -----------------------------------------DokuEx------------------------------%
-            self.DocuEx.szPreFilter = header[83]  # .rstrip('\x00')
-            self.DocuEx.aiReserved = header[84:92]
-
-            # ---------------------------------------RekoParamEx---------------------------%
-            self.RecoParamEx.fRecVolMin = header[92]
-            self.RecoParamEx.fRecVolMax = header[93]
-            self.RecoParamEx.fOffset = header[94]
-            self.RecoParamEx.nZRecoNumMax = header[95]
-            self.RecoParamEx.nZFirstSlice = header[96]
-            self.RecoParamEx.nZLastSlice = header[97]
-            self.RecoParamEx.uiCTAlgorithm = header[98]
-            self.RecoParamEx.eUsedCTFilter = header[99]
-            self.RecoParamEx.eUsedCTAlgorithmPlatform = header[100]
-            self.RecoParamEx.eUsedCTProjectionPadding = header[101]
-            self.RecoParamEx.fPaddingObjectRadius = header[102]
-            self.RecoParamEx.aiReserved = header[103:108]
-
-            # -------------------------------------------Helix-----------------------------%
-            self.Helix.lfZShift = header[108]
-            self.Helix.lfScanRange = header[109]
-            self.Helix.nProjPerZShift = header[110]
-            self.Helix.nAlign = header[111]
-
-            # -----------------------------------------ArbitGeom---------------------------%
-            self.ArbitGeom.agvSource = header[112:115]
-            self.ArbitGeom.agvSourceDirection = header[115:118]
-            self.ArbitGeom.agvDetectorCenter = header[118:121]
-            self.ArbitGeom.agvDetLineDirection = header[121:124]
-            self.ArbitGeom.agvDetColumnDirection = header[124:127]
-            self.ArbitGeom.agvRecoReference = header[127:130]
-            self.ArbitGeom.aaRecoOrientation = header[130:134]
-
-            # --------------------------------------Range Extension------------------------%
-            self.RangeExtension.nRangeExtensionSizeRow = header[134]
-            self.RangeExtension.nRangeExtensionSizeColumn = header[135]
-            self.RangeExtension.nMultiscan = header[136]
-            self.RangeExtension.nAlign = header[137]
-
-            # --------------------------------------------Leer-----------------------------%
-            self.Empty = header[138]  # .rstrip('\x00')
-
-            # ------------------------------------------Platform---------------------------%
-            self.Platform.uiEndian = header[139]
-            self.Platform.nReserved1 = header[140]
-            self.Platform.uiEndi64 = header[141]
-
-            # --------------------------------------------User-----------------------------%
-            self.User.strUserString = header[142]  # .rstrip('\x00')
-
+            i = 0
+            for section, field, _, count in headerFields:
+                self.record[f"{section}.{field}"] = headerUnpacked[i] if count == 1 else headerUnpacked[i:i + count]
+                i += count
             return 0
 
         except Exception as e:
@@ -239,165 +217,22 @@ class Header(object):
             return -1
 
     def getUnpacked(self):
-
         try:
             header = []
-            header[0:8] = np.int16([
-                self.Image.siWidth,
-                self.Image.siHeight,
-                self.Image.siDepth,
-                self.Image.siAmount,
-                self.Image.siHeaderLength,
-                self.Image.siVerMajor,
-                self.Image.siVerMinor,
-                self.Image.siVerRevision
-            ])
-
-            header[8:19] = np.int32([
-                self.Meas.nMeasId,
-                self.Meas.nFdd,
-                self.Meas.nFod,
-                self.Meas.nProjectionNo,
-                self.Meas.nDetWidth,
-                self.Meas.nDetHeight,
-                self.Meas.nPixelsH,
-                self.Meas.nPixelsV,
-                self.Meas.nMeasAreaStart,
-                self.Meas.nRecoLineStart,
-                self.Meas.nRecoLineEnd
-            ])
-
-            header[19:20] = np.float32([self.Meas.fPixelWidth])
-            header[20:21] = np.uint32([self.Meas.uiAcquisitionGeom])
-            header[21:22] = np.int32([self.Meas.nUnused])
-
-            header[22:25] = np.float64([
-                self.Meas.lfShiftH,
-                self.Meas.lfShiftV,
-                self.Meas.lfTiltAngle
-            ])
-
-            header[25:33] = np.int32([
-                self.Docu.nVoltage,
-                self.Docu.nCurrent,
-                self.Docu.nIntegrationTime,
-                self.Docu.nFrameAverage,
-                self.Docu.nSkip,
-                self.Docu.nZPosition,
-                self.Docu.nYDetPos,
-                self.Docu.nYSamplePos
-            ])
-
-            header.append(self.Docu.cMeasName)  # append here to append the whole string into one element
-            header.append(self.Docu.cDate)
-            header.append(self.Docu.cTime)
-            header[36:37] = np.int32([self.Docu.nBeam])
-            header[37:68] = np.float32(self.Docu.fBeam[0:31])
-
-            header[68:72] = np.int32([
-                self.Docu.nKeepData,
-                self.RecoParam.nXRecoNumber,
-                self.RecoParam.nYRecoNumber,
-                self.RecoParam.nZRecoNumber
-            ])
-
-            header[72:75] = np.float32([
-                self.RecoParam.fRecNorm,
-                self.RecoParam.fVoxelX,
-                self.RecoParam.fVoxelZ
-            ])
-
-            header[75:76] = np.uint32([self.I0.uiNull])
-            header[76:80] = np.int16([
-                self.I0.siXPos,
-                self.I0.siYPos,
-                self.I0.siDeltaX,
-                self.I0.siDeltaY
-            ])
-
-            header[80:81] = np.int32([self.I0.nAlign])
-            header[81:83] = np.float64([
-                self.LimitedAngle.lfStartAngle,
-                self.LimitedAngle.lfAngleStep
-            ])
-
-            header.append(self.DocuEx.szPreFilter)
-            header[84:92] = np.int32(self.DocuEx.aiReserved[0:8])
-            header[92:95] = np.float32([
-                self.RecoParamEx.fRecVolMin,
-                self.RecoParamEx.fRecVolMax,
-                self.RecoParamEx.fOffset
-            ])
-
-            header[95:98] = np.int32([
-                self.RecoParamEx.nZRecoNumMax,
-                self.RecoParamEx.nZFirstSlice,
-                self.RecoParamEx.nZLastSlice
-            ])
-
-            header[98:102] = np.uint32([
-                self.RecoParamEx.uiCTAlgorithm,
-                self.RecoParamEx.eUsedCTFilter,
-                self.RecoParamEx.eUsedCTAlgorithmPlatform,
-                self.RecoParamEx.eUsedCTProjectionPadding
-            ])
-
-            header[102:103] = np.float32([self.RecoParamEx.fPaddingObjectRadius])
-            header[103:108] = np.int32(self.RecoParamEx.aiReserved[0:5])
-
-            header[108:110] = np.float64([
-                self.Helix.lfZShift,
-                self.Helix.lfScanRange
-            ])
-
-            header[110:112] = np.int32([
-                self.Helix.nProjPerZShift,
-                self.Helix.nAlign
-            ])
-
-            header[112:115] = np.float64(self.ArbitGeom.agvSource[0:3])
-            header[115:118] = np.float64(self.ArbitGeom.agvSourceDirection[0:3])
-            header[118:121] = np.float64(self.ArbitGeom.agvDetectorCenter[0:3])
-            header[121:124] = np.float64(self.ArbitGeom.agvDetLineDirection[0:3])
-            header[124:127] = np.float64(self.ArbitGeom.agvDetColumnDirection[0:3])
-            header[127:130] = np.float64(self.ArbitGeom.agvRecoReference[0:3])
-            header[130:134] = np.float64(self.ArbitGeom.aaRecoOrientation[0:4])
-
-            header[134:138] = np.int32([
-                self.RangeExtension.nRangeExtensionSizeRow,
-                self.RangeExtension.nRangeExtensionSizeColumn,
-                self.RangeExtension.nMultiscan,
-                self.RangeExtension.nAlign
-            ])
-
-            header.append(self.Empty)
-
-            header[139:140] = np.uint32([self.Platform.uiEndian])
-            header[140:141] = np.int32([self.Platform.nReserved1])
-            header[141:142] = np.uint64([self.Platform.uiEndi64])
-
-            header.append(self.User.strUserString)
-
-            headerUnpacked = header
-
-            return 0, headerUnpacked
+            for section, field, _, count in headerFields:
+                value = self.record[f"{section}.{field}"]
+                if count == 1:
+                    header.append(value.item())
+                else:
+                    header += value.tolist()
+            return 0, header
 
         except Exception as e:
             print(e)
             return -1, None
 
     def getPacked(self):
-        (rc, headerUnpacked) = self.getUnpacked()
-
-        if rc == 0:
-            try:
-                headerPacked = pack(Header.decodeString, *headerUnpacked)
-                return (0, headerPacked)
-            except Exception as e:
-                print(e)
-                return (-1, None)
-        else:
-            print("Operation failed in getPacked")
+        return 0, self.record.tobytes()
 
 
 # vytvoření souboru s hlavičkou:
@@ -427,22 +262,57 @@ def updateHeader(path, header):
             print("Operation failed in updateHeader")
 
 
-def addHeader(path, header):
+def updateHeaderField(paths, field, values, workers=8):
+    """Writes one header field of many files in place, touching only the bytes of the field.
+    updateHeaderField(paths, field, values, workers=8)
+    paths = list of paths to the files
+    field = name of the field in headerDtype, e.g. "Meas.fPixelWidth"
+    values = single value for all the files or a sequence with one value per file
+    """
+    fieldDtype, offset = headerDtype.fields[field][:2]
+    if np.ndim(values) > len(fieldDtype.shape):
+        packed = [np.asarray(value, fieldDtype.base).tobytes() for value in values]
+    else:
+        packed = [np.asarray(values, fieldDtype.base).tobytes()] * len(paths)
+    if len(packed) != len(paths):
+        raise ValueError(f"{len(packed)} values of {field} given for {len(paths)} files")
+    for value in packed:
+        if len(value) != fieldDtype.itemsize:
+            raise ValueError(f"Value of {field} must have {fieldDtype.itemsize} bytes")
+
+    def write(path, value):
+        with open(path, 'r+b', buffering=0) as soubor:
+            soubor.seek(offset)
+            soubor.write(value)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(write, paths, packed))
+
+
+def addHeader(path, header, chunkSize=2 ** 24):
     """Adds header to a file specified in the path.
-    writeHeader(path, header)
+    addHeader(path, header, chunkSize=2 ** 24)
     path = path to the file
     header = instance of the class Header with the header information
+    The image is streamed in chunks of chunkSize bytes to a temporary file which then atomically replaces
+    the original, so neither the memory nor the original file depend on the size of the image.
     """
-
-    with open(path, 'r+b') as soubor:
-        image = soubor.read()
-        soubor.seek(0)
-        rc, headerPacked = header.getPacked()
-        if rc == 0:
-            newFile = headerPacked + image
-            soubor.write(newFile)
-        else:
-            print("Operation failed in addHeader")
+    rc, headerPacked = header.getPacked()
+    if rc != 0:
+        print("Operation failed in addHeader")
+        return
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, tmpPath = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as novy, open(path, 'rb') as soubor:
+            novy.write(headerPacked)
+            shutil.copyfileobj(soubor, novy, chunkSize)
+        shutil.copymode(path, tmpPath)
+        os.replace(tmpPath, path)
+    except BaseException:
+        os.remove(tmpPath)
+        raise
 
 
 def readHeader(path):
@@ -453,46 +323,192 @@ def readHeader(path):
     return header
 
 
+def readHeaders(paths):
+    """Reads the headers of many files into one structured array of headerDtype.
+    readHeaders(paths)
+    paths = list of paths to the files
+    Every header is read straight into its row of the array, headers[i]["Meas.nProjectionNo"] etc. give the
+    fields and Header(record=headers[i:i + 1].reshape(())) gives the usual attribute access without a copy.
+    """
+    headers = np.zeros(len(paths), headerDtype)
+    rows = headers.view(np.uint8).reshape(len(paths), 2048)
+    for i, path in enumerate(paths):
+        with open(path, 'rb', buffering=0) as soubor:
+            soubor.readinto(rows[i])
+    return headers
+
+
 ##############################################################################################################
 
 
 def getHeaderVersion(path):
-    with open(path) as s:
-        s.seek(10)
-        version = np.fromfile(s, 'uint16', 3)
+    with open(path, 'rb') as s:
+        s.seek(headerDtype.fields["Image.siVerMajor"][1])
+        version = np.frombuffer(s.read(6), '<u2').astype(int)
 
     version = 100 * version[0] + 10 * version[1] + version[2]
     return str(version)
 
 
 def loadImageOnly(path, header):
+    # the image is stored at the end of the file, so only its bytes are read
+    dataType = np.dtype(getDataType(header))
+    shape = (header.Image.siHeight, header.Image.siWidth)
     with open(path, 'rb') as soubor:
-        s = np.fromfile(soubor, 'uint16')
-
-    s = s[-header.Image.width * header.Image.height:]
-    s = s.reshape((header.Image.height, header.Image.width))
+        soubor.seek(-shape[0] * shape[1] * dataType.itemsize, os.SEEK_END)
+        s = np.fromfile(soubor, dataType, shape[0] * shape[1])
 
-    return s
+    return s.reshape(shape)
 
 
-def loadImage(path):
+def getDataType(header):
     typeList = ['int8', 'int16', 'int32', 'int64', 'uint8', 'uint16', 'uint32', 'uint64', 'float8', 'float16',
                 'float32', 'float64']
-
-    with open(path, 'rb') as soubor:
-        souborAll = soubor.read()
-
-    headerPacked = souborAll[:2048]
-    header = Header(headerPacked=headerPacked)
+    # first 8 characters in user string reserved for data type information
+    userString = header.User.strUserString[:8]
+    if isinstance(userString, bytes):
+        userString = userString.decode('ascii', 'ignore')
     dataType = 'uint16'  # default
     for dataTypeTemp in typeList:
-        if dataTypeTemp in header.User.strUserString[:8]:
+        if dataTypeTemp in userString:
             dataType = dataTypeTemp
+    return dataType
 
-    # dataType = header.User.strUserString[:8].rstrip('\x00')
-    # first 8 characters in user string reserved for data type information
 
-    matrix = np.fromstring(souborAll[2048:], dataType)
-    matrix = matrix.reshape((header.Image.siHeight, header.Image.siWidth))
+def loadImage(path, mmap=False):
+    """Loads header and image from an EZRT raw file.
+    loadImage(path, mmap=False)
+    path = path to the file
+    mmap = if True, the image is returned as a read-only memmap into the file instead of a copy in memory
+    """
+    header = readHeader(path)
+    dataType = getDataType(header)
+    shape = (header.Image.siHeight, header.Image.siWidth)
+
+    if mmap:
+        matrix = np.memmap(path, dtype=dataType, mode='r', offset=2048, shape=shape)
+    else:
+        with open(path, 'rb') as soubor:
+            soubor.seek(2048)
+            matrix = np.fromfile(soubor, dataType, shape[0] * shape[1])
+        matrix = matrix.reshape(shape)
 
     return header, matrix
+
+
+def loadFrames(path, mmap=False):
+    """Returns the header and one lazy frame per image stored in the file.
+    loadFrames(path, mmap=False)
+    path = path to the file
+    mmap = if True, the frames are read as memmaps into the file, otherwise each frame is copied when read
+    Frame N is read at offset 2048 + N * frame size, without touching the frames before it.
+    """
+    header = readHeader(path)
+    dataType = getDataType(header)
+    shape = (header.Image.siHeight, header.Image.siWidth)
+    frameSize = shape[0] * shape[1] * np.dtype(dataType).itemsize
+    amount = min(max(1, header.Image.siAmount), (os.path.getsize(path) - 2048) // frameSize)
+    frames = [MemmapFrame(path, 2048 + i * frameSize, shape, dataType, copy=not mmap) for i in range(amount)]
+    return header, frames
+
+
+def loadRegion(path, rows=None, cols=None, step=1, frame=0):
+    """Loads header and a part of the image from an EZRT raw file, reading only the bytes of that part.
+    loadRegion(path, rows=None, cols=None, step=1, frame=0)
+    path = path to the file
+    rows = (first, stop) range of rows, all rows if None
+    cols = (first, stop) range of columns, all columns if None
+    step = only every step-th row and column is read, e.g. for an overview of a large mosaic
+    frame = index of the frame in multi-frame files
+    """
+    header = readHeader(path)
+    dataType = getDataType(header)
+    shape = (header.Image.siHeight, header.Image.siWidth)
+    y0, y1 = rows if rows is not None else (0, shape[0])
+    x0, x1 = cols if cols is not None else (0, shape[1])
+    if not (0 <= y0 <= y1 <= shape[0] and 0 <= x0 <= x1 <= shape[1]):
+        raise ValueError(f"Region [{y0}:{y1}, {x0}:{x1}] is outside of the image of shape {shape}")
+    offset = 2048 + frame * shape[0] * shape[1] * np.dtype(dataType).itemsize
+    matrix = read_region(path, offset, shape, dataType, y0, y1, x0, x1, step)
+
+    return header, matrix
+
+
+class RawStackWriter(object):
+    """Writes frames one after another into a single multi-frame raw file.
+    RawStackWriter(path, header, shape, dataType='uint16', amount=0, bufferFrames=8)
+    path = path to the file
+    header = instance of the class Header, its Image and data type fields are filled in by the writer
+    shape = (height, width) of the frames
+    amount = expected number of frames, the file is preallocated for them
+    bufferFrames = number of frames waiting for the disk before write() blocks
+    Image.siAmount is written when the writer is closed.
+    """
+
+    def __init__(self, path, header, shape, dataType='uint16', amount=0, bufferFrames=8):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dataType = np.dtype(dataType)
+        self.frameSize = self.shape[0] * self.shape[1] * self.dataType.itemsize
+        self.amount = 0
+        self.error = None
+
+        header = Header(headerPacked=header.getPacked()[1])
+        header.Image.siHeight, header.Image.siWidth = self.shape
+        header.Image.siAmount = 0
+        header.Image.siVerMajor = Header.siVerMajor
+        header.Image.siVerMinor = Header.siVerMinor
+        header.Image.siVerRevision = Header.siVerRevision
+        header.User.strUserString = self.dataType.name.encode().ljust(8, b"\0") + header.User.strUserString[8:]
+
+        self.soubor = open(path, 'wb')
+        self.soubor.write(header.getPacked()[1])
+        if amount > 0:
+            size = 2048 + amount * self.frameSize
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(self.soubor.fileno(), 0, size)
+            else:
+                self.soubor.truncate(size)
+
+        self.queue = queue.Queue(maxsize=bufferFrames)
+        self.thread = threading.Thread(target=self._writeBehind, daemon=True)
+        self.thread.start()
+
+    def _writeBehind(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                return
+            if self.error is None:
+                try:
+                    self.soubor.write(frame)
+                except Exception as e:
+                    self.error = e
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame of shape {frame.shape} does not fit the stack of {self.shape}")
+        if self.amount >= np.iinfo(np.int16).max:
+            raise ValueError("Image.siAmount can not describe more frames")
+        self.queue.put(np.array(frame, self.dataType, copy=True))  # the caller may reuse its buffer
+        self.amount += 1
+
+    def close(self):
+        if self.soubor.closed:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.soubor.truncate(2048 + self.amount * self.frameSize)
+        self.soubor.seek(headerDtype.fields["Image.siAmount"][1])
+        self.soubor.write(np.int16(self.amount).tobytes())
+        self.soubor.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,91 @@
+import os
+import re
+import time
+
+from PyQt5.QtCore import pyqtSignal, QThread, QMutex, QWaitCondition, QFileSystemWatcher
+
+from . import EZRT
+from .global_vars import supportedLoadFormats
+
+watch_orders = ["natural", "header"]
+watched_formats = set(supportedLoadFormats) | {"tiff", "jpeg"}
+
+
+def natural_key(path):
+    return [int(x) if x.isdigit() else x.lower() for x in re.split(r"(\d+)", os.path.basename(path))]
+
+
+def header_key(path):
+    # EZRT projections are ordered by their projection number, other files fall back to their names
+    if path.endswith(".raw"):
+        try:
+            return 0, EZRT.readHeader(path).Meas.nProjectionNo, natural_key(path)
+        except Exception:
+            pass
+    return 1, 0, natural_key(path)
+
+
+class FolderWatcherThread(QThread):
+    files_ready = pyqtSignal(list, str, name="files_ready")
+
+    def __init__(self, parent=None, directory: str = "", slot: str = "a", order: str = "natural",
+                 poll_interval: float = 1., settle_time: float = .2):
+        super().__init__(parent=parent)
+        self.mutex = QMutex()
+        self.condition = QWaitCondition()
+        self.directory = directory
+        self.slot = slot
+        self.order = order
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.seen = {f"{directory}/{entry.name}" for entry in os.scandir(directory)}
+        self.pending = {}
+
+        # inotify (ReadDirectoryChangesW on Windows) wakes the thread immediately, polling covers the file
+        # systems where the notifications are not delivered, e.g. network shares
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(lambda _: self.wake())
+        self.notifications = self.watcher.addPath(directory)
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            ready = self._scan()
+            if ready:
+                self.files_ready.emit(ready, self.slot)
+            self.wait_for_signal(self.settle_time if self.pending else self.poll_interval)
+
+    def _scan(self):
+        now = time.monotonic()
+        ready = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return ready
+        for entry in entries:
+            path = f"{self.directory}/{entry.name}"  # the rest of the application splits paths on "/"
+            if path in self.seen or entry.name.split(".")[-1].lower() not in watched_formats:
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            previous = self.pending.get(path)
+            if previous is None or previous[:2] != (stat.st_size, stat.st_mtime):
+                # the file is still being written, check again once its size settles
+                self.pending[path] = (stat.st_size, stat.st_mtime, now)
+            elif stat.st_size > 0 and now - previous[2] >= self.settle_time:
+                ready.append(path)
+        for path in ready:
+            self.pending.pop(path)
+            self.seen.add(path)
+        return sorted(ready, key=header_key if self.order == "header" else natural_key)
+
+    def wait_for_signal(self, timeout: float):
+        self.mutex.lock()
+        self.condition.wait(self.mutex, int(timeout * 1000))
+        self.mutex.unlock()
+
+    def wake(self):
+        self.mutex.lock()
+        self.condition.wakeAll()
+        self.mutex.unlock()
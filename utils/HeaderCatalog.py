@@ -0,0 +1,80 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .EZRT import headerDtype, readHeaders
+
+# header fields stored in their own indexed columns, every other field is available through headers()
+catalog_fields = ["Meas.nProjectionNo", "LimitedAngle.lfStartAngle", "LimitedAngle.lfAngleStep",
+                  "Docu.nVoltage", "Docu.nCurrent", "Docu.nIntegrationTime", "Meas.nMeasId",
+                  "Image.siWidth", "Image.siHeight", "Image.siAmount"]
+
+
+class HeaderCatalog:
+    """Index of the headers of EZRT raw files kept in a SQLite database, updated incrementally by mtime."""
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        columns = "".join(f', "{field}"' for field in catalog_fields)
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS headers '
+                                f'(path TEXT PRIMARY KEY, mtime REAL, size INTEGER, header BLOB{columns})')
+        for i, field in enumerate(catalog_fields):
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS field_{i} ON headers ("{field}")')
+        self.connection.commit()
+
+    @staticmethod
+    def _range(directory):
+        # paths inside the directory sort between "<directory>/" and "<directory>0" ("0" follows "/")
+        directory = directory.replace("\\", "/").rstrip("/")
+        return directory + "/", directory + "0"
+
+    def scan(self, directory, workers=8, chunk=256):
+        """Reads the headers of the new and modified .raw files in the directory tree, returns their number."""
+        files = {}
+        for root, _, names in os.walk(directory):
+            root = root.replace("\\", "/")
+            for name in names:
+                if name.lower().endswith(".raw"):
+                    path = f"{root}/{name}"
+                    stat = os.stat(path)
+                    files[path] = (stat.st_mtime, stat.st_size)
+
+        known = dict((path, (mtime, size)) for path, mtime, size in self.connection.execute(
+            "SELECT path, mtime, size FROM headers WHERE path >= ? AND path < ?", self._range(directory)))
+        removed = [(path,) for path in known if path not in files]
+        changed = [path for path, stat in files.items() if known.get(path) != stat and stat[1] >= 2048]
+
+        chunks = [changed[i:i + chunk] for i in range(0, len(changed), chunk)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for paths, headers in zip(chunks, executor.map(readHeaders, chunks)):
+                rows = [(path, *files[path], header.tobytes(), *(header[field].item() for field in catalog_fields))
+                        for path, header in zip(paths, headers)]
+                self.connection.executemany(f'INSERT OR REPLACE INTO headers VALUES '
+                                            f'({", ".join("?" * (4 + len(catalog_fields)))})', rows)
+        self.connection.executemany("DELETE FROM headers WHERE path = ?", removed)
+        self.connection.commit()
+        return len(changed)
+
+    def query(self, directory, order_by="Meas.nProjectionNo", where="", parameters=(), descending=False):
+        """Returns the paths of the cataloged files in the directory tree sorted by a header field.
+        where is an optional SQL condition on the catalog_fields columns, e.g. '"Docu.nVoltage" > ?'.
+        """
+        if order_by not in catalog_fields:
+            raise ValueError(f"\"{order_by}\" is not an indexed header field")
+        condition = f" AND ({where})" if where else ""
+        rows = self.connection.execute(f'SELECT path FROM headers WHERE path >= ? AND path < ?{condition} '
+                                       f'ORDER BY "{order_by}" {"DESC" if descending else "ASC"}, path',
+                                       (*self._range(directory), *parameters))
+        return [row[0] for row in rows]
+
+    def headers(self, directory):
+        """Returns the paths and a structured array of all headers in the directory tree."""
+        rows = self.connection.execute("SELECT path, header FROM headers WHERE path >= ? AND path < ? ORDER BY path",
+                                       self._range(directory)).fetchall()
+        headers = np.frombuffer(b"".join(row[1] for row in rows), headerDtype)
+        return [row[0] for row in rows], headers
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+cached_formats = ['txt', 'tif', 'tiff', 'png', 'jpg', 'jpeg']
+
+
+class ImageCache:
+    """On-disk cache of decoded images stored as .npy files, evicted in least recently used order.
+
+    The modification time of a cache file marks its last use, so the order survives restarts and is shared
+    by all processes of the loader pool.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".npy"))
+
+    @classmethod
+    def get(cls, directory, max_size):
+        with cls._instances_lock:
+            cache = cls._instances.get(directory)
+            if cache is None:
+                cache = cls._instances[directory] = ImageCache(directory, max_size)
+            cache.max_size = max_size
+            return cache
+
+    @staticmethod
+    def key(filepath, params):
+        stat = os.stat(filepath)
+        # only the parameters affecting the decoding are part of the key
+        parts = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size,
+                 params.dtype, params.width, params.height, params.header)
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def load(self, key, mmap=False):
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return np.load(path, mmap_mode='r' if mmap else None)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key, arr):
+        if arr.nbytes > self.max_size:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.size += os.path.getsize(path)
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        self.size = sum(entry[1] for entry in entries)
+        # evict a bit more than necessary, so that the directory is not rescanned after every store
+        limit = .9 * self.max_size
+        for _, size, path in entries:
+            if self.size <= limit:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except OSError:  # still mapped by an image on Windows
+                pass
@@ -1,59 +1,155 @@
 import os.path
 import queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from PyQt5.QtCore import pyqtSignal, QThread, QMutex, QWaitCondition
 import numpy as np
 from PIL import Image as Image
 import tifffile
-from . import EZRT
+from . import EZRT, PBF
+from .frames import tiff_frames, MemmapFrame
+from .ZarrStore import ZarrStore
+from .global_vars import lazy_region_pixels
+from .ImageCache import ImageCache, cached_formats
+from .utils import load_txt
+
+
+def is_large(frame):
+    # large frames stay on disk and only the viewed regions of them are read
+    return frame.shape[0] * frame.shape[1] > lazy_region_pixels
+
+
+def load_image(filepath, params):
+    """Returns the frames stored in the file, each either a numpy array or a lazy frame."""
+    fex = filepath.split('.')[-1]
+    if fex == 'txt':
+        arr = load_txt(filepath, params.dtype)
+    elif fex == 'raw':
+        _, frames = EZRT.loadFrames(filepath, mmap=params.memmap)
+        if len(frames) > 1 or is_large(frames[0]):
+            return frames
+        _, arr = EZRT.loadImage(filepath, mmap=params.memmap)
+    elif fex == 'pbf' and os.path.exists(PBF.descriptor_path(filepath)):
+        frames = PBF.load_frames(filepath, mmap=params.memmap)
+        if len(frames) > 1 or is_large(frames[0]):
+            return frames
+        arr = frames[0].read()
+    elif fex == 'zarr':
+        frames = ZarrStore(filepath).frames()
+        if len(frames) > 1 or is_large(frames[0]):
+            return frames
+        arr = frames[0].read()
+    elif fex in ['jpg', 'jpeg', 'png']:
+        arr = Image.open(filepath)
+        arr = np.array(arr.convert('L'))
+    elif fex in ['tiff', 'tif']:
+        frames = tiff_frames(filepath)
+        if frames is not None:
+            return frames
+        arr = None
+        if params.memmap:
+            try:  # only uncompressed contiguous images can be mapped
+                arr = tifffile.memmap(filepath, mode='r')
+            except ValueError:
+                pass
+        if arr is None or len(arr.shape) != 2:
+            arr = tifffile.imread(filepath)
+        if len(arr.shape) == 1:
+            arr = None
+        elif len(arr.shape) > 2:
+            if arr.shape[2] > 3:
+                arr = arr[:, :, :3]
+            arr = np.dot(arr, [0.299, 0.587, 0.114])
+    else:
+        offset = (os.path.getsize(filepath) -
+                  (params.width*params.height*np.dtype(params.dtype).itemsize))
+        frame = MemmapFrame(filepath, offset, (params.width, params.height), params.dtype, copy=not params.memmap)
+        if is_large(frame):
+            return [frame]
+        arr = frame.read()
+    return None if arr is None else [arr]
+
+
+def load_image_cached(filepath, params):
+    """Returns the frames and whether they came from the decoded image cache (None if not cacheable)."""
+    if not params.cache or filepath.split('.')[-1].lower() not in cached_formats:
+        return load_image(filepath, params), None
+    cache = ImageCache.get(params.cache_dir, params.cache_size * 2 ** 20)
+    key = ImageCache.key(filepath, params)
+    arr = cache.load(key, mmap=params.memmap)
+    if arr is not None:
+        return [arr], True
+    frames = load_image(filepath, params)
+    if frames is not None and len(frames) == 1 and type(frames[0]) is np.ndarray:
+        cache.store(key, frames[0])
+    return frames, False
+
+
+def load_image_mapped(filepath, params):
+    """load_image_cached for the process pool, memmaps would arrive as copies, so frames of their files are sent."""
+    frames, hit = load_image_cached(filepath, params)
+    if frames is not None:
+        frames = [MemmapFrame(f.filename, f.offset, f.shape, f.dtype, copy=False)
+                  if isinstance(f, np.memmap) and f.filename is not None and f.flags.c_contiguous else f
+                  for f in frames]
+    return frames, hit
 
 
 class ImageLoaderThread(QThread):
     image_loaded = pyqtSignal(tuple, name="image_loaded")
     last_image = pyqtSignal(name="last_image")
+    throughput = pyqtSignal(int, float, float, name="throughput")
+    cache_stats = pyqtSignal(int, int, name="cache_stats")
 
-    def __init__(self, parent=None, image_queue: queue.Queue = None):
+    def __init__(self, parent=None, image_queue: queue.Queue = None, workers: int = 1, pool: str = "thread"):
         super().__init__(parent=parent)
         self.mutex = QMutex()
         self.condition = QWaitCondition()
         self.image_queue = image_queue
+        self.workers = workers
+        self.pool = pool
 
     def run(self):
         self.wait_for_signal()
         while not self.isInterruptionRequested():
-            while not self.image_queue.empty():
-                filepath, params, slot = self.image_queue.get()
-                fex = filepath.split('.')[-1]
-                try:
-                    if fex == 'txt':
-                        with open(filepath, 'r') as f:
-                            arr = np.array([[x for x in line.split()] for line in f], params.dtype)
-                    elif fex == 'raw':
-                        _, arr = EZRT.loadImage(filepath)
-                    elif fex in ['jpg', 'jpeg', 'png']:
-                        arr = Image.open(filepath)
-                        arr = np.array(arr.convert('L'))
-                    elif fex in ['tiff', 'tif']:
-                        arr = tifffile.imread(filepath)
-                        if len(arr.shape) == 1:
-                            arr = None
-                        elif len(arr.shape) > 2:
-                            if arr.shape[2] > 3:
-                                arr = arr[:, :, :3]
-                            arr = np.dot(arr, [0.299, 0.587, 0.114])
-                    else:
-                        offset = (os.path.getsize(filepath) -
-                                  (params.width*params.height*np.dtype(params.dtype).itemsize))
-                        arr = np.memmap(filepath, mode='r', dtype=params.dtype, shape=(params.width, params.height),
-                                        offset=offset)
-                        arr = np.array(arr)
-                except Exception as e:
-                    arr = None
-                    filepath = e
-                self.image_loaded.emit((arr, filepath, slot))
-                if self.image_queue.empty():
-                    self.last_image.emit()
+            # threads suit tifffile/PIL which release the GIL, processes suit pure Python parsing (txt)
+            executor_class = ProcessPoolExecutor if self.pool == "process" else ThreadPoolExecutor
+            with executor_class(max_workers=max(1, self.workers)) as executor:
+                self._drain(executor)
             self.wait_for_signal()
 
+    def _drain(self, executor):
+        # results are emitted in submission order, so every slot receives its files in the order they were queued
+        pending = deque()
+        files, size, start = 0, 0, time.perf_counter()
+        hits, misses = 0, 0
+        while not self.isInterruptionRequested():
+            while not self.image_queue.empty() and len(pending) < 2 * max(1, self.workers):
+                filepath, params, slot = self.image_queue.get()
+                load = load_image_mapped if self.pool == "process" else load_image_cached
+                pending.append((executor.submit(load, filepath, params), filepath, slot))
+            if not pending:
+                break
+            future, filepath, slot = pending.popleft()
+            try:
+                frames, hit = future.result()
+                size += os.path.getsize(filepath)
+                hits += hit is True
+                misses += hit is False
+            except Exception as e:
+                frames = None
+                filepath = e
+            files += 1
+            self.image_loaded.emit((frames, filepath, slot))
+            if not pending and self.image_queue.empty():
+                self.last_image.emit()
+        elapsed = time.perf_counter() - start
+        if files > 0 and elapsed > 0:
+            self.throughput.emit(files, files / elapsed, size / elapsed / 2 ** 20)
+        if hits + misses > 0:
+            self.cache_stats.emit(hits, misses)
+
     def wait_for_signal(self):
         self.mutex.lock()
         self.condition.wait(self.mutex)
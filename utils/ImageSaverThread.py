@@ -1,38 +1,99 @@
 import os
 import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from PyQt5.QtCore import pyqtSignal, QThread, QMutex, QWaitCondition
 
-from .utils import get_save_image
+from .utils import get_save_image, get_save_stack, batch_range
 
 
 class ImageSaverThread(QThread):
     image_saved = pyqtSignal(str, name="image_saved")
+    save_failed = pyqtSignal(str, str, name="save_failed")
     delete_signal = pyqtSignal(int, name="delete_signal")
 
-    def __init__(self, parent=None, image_queue: queue.Queue = None, images=None):
+    def __init__(self, parent=None, image_queue: queue.Queue = None, images=None, workers: int = 1):
         super().__init__(parent=parent)
         self.mutex = QMutex()
         self.condition = QWaitCondition()
         self.image_queue = image_queue
         self.images = images
+        self.workers = workers
 
     def run(self):
         self.wait_for_signal()
         while not self.isInterruptionRequested():
-            while not self.image_queue.empty():
-                im_id, ftype, file_path, kwargs = self.image_queue.get()
-                image = self.images[im_id]
-                name = image.filepath.split("/")[-1].split(".")[:-1]
-                name = "".join(name)
-                while os.path.exists(os.path.join(file_path, name + "." + ftype)):
-                    name = name + "(1)"
-                get_save_image(ftype)(image.array, name, file_path, **kwargs)
-                self.image_saved.emit(os.path.join(file_path, name + "." + ftype))
-                if "remove" in kwargs.keys():
-                    self.delete_signal.emit(im_id)
+            # tifffile, zlib and PIL encoders release the GIL, so threads are enough for CPU-bound formats
+            with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+                self._drain(executor)
             self.wait_for_signal()
 
+    def _drain(self, executor):
+        # files are reported and removed in the order they were queued, however the workers finish them
+        pending = deque()
+        reserved = set()
+        while not self.isInterruptionRequested():
+            while not self.image_queue.empty() and len(pending) < 2 * max(1, self.workers):
+                im_id, ftype, file_path, kwargs = self.image_queue.get()
+                try:
+                    future, path, kwargs = self._submit(executor, reserved, im_id, ftype, file_path, kwargs)
+                except Exception as e:  # e.g. the image was removed before its turn came
+                    self.save_failed.emit(file_path, str(e))
+                    continue
+                pending.append((future, im_id, path, kwargs))
+            if not pending:
+                break
+            future, im_id, path, kwargs = pending.popleft()
+            try:
+                future.result()
+            except Exception as e:
+                self.save_failed.emit(path, str(e))
+                continue
+            self.image_saved.emit(path)
+            if "remove" in kwargs.keys():
+                for i in (im_id if isinstance(im_id, list) else [im_id]):
+                    self.delete_signal.emit(i)
+
+    def _submit(self, executor, reserved, im_id, ftype, file_path, kwargs):
+        # a list of ids is saved as one stack file named after its first image
+        stack = isinstance(im_id, list)
+        if stack and not im_id:
+            raise ValueError("No images to save")
+        first = im_id[0] if stack else im_id
+        if first not in self.images.keys():
+            raise ValueError(f"Image {first} was removed before it was saved")
+        image = self.images[first]
+        name = kwargs.get("name")
+        if name is None:
+            name = "".join(image.filepath.split("/")[-1].split(".")[:-1])
+            # names are reserved before the files exist, so parallel saves never pick the same one
+            while os.path.exists(os.path.join(file_path, name + "." + ftype)) or \
+                    os.path.join(file_path, name + "." + ftype) in reserved:
+                name = name + "(1)"
+        path = os.path.join(file_path, name + "." + ftype)
+        reserved.add(path)
+        if "common_range" in kwargs.keys() and "value_range" not in kwargs.keys():
+            # the kwargs are shared by the whole batch, so its range is computed only once
+            # frames of lazy images are read by the workers one by one and not kept
+            images = [self.images[i] for i in kwargs["common_range"] if i in self.images.keys()]
+            kwargs["value_range"] = batch_range(images, executor, read=lambda im: im.read(oriented=False))
+        kwargs = dict((k, v) for k, v in kwargs.items() if k not in ["name", "common_range"])
+        # encoders with their own threads (tifffile) share the cores with the other workers
+        kwargs["maxworkers"] = max(1, (os.cpu_count() or 1) // max(1, self.workers))
+        if stack:
+            # the frames are read one at a time by the worker while it writes them, lazy ones are not kept
+            arrays = (self.images[i].read() for i in im_id if i in self.images.keys())
+            future = executor.submit(get_save_stack(ftype), arrays, name, file_path, amount=len(im_id), **kwargs)
+        else:
+            future = executor.submit(self._save_image, ftype, image, name, file_path, kwargs)
+        return future, path, kwargs
+
+    @staticmethod
+    def _save_image(ftype, image, name, file_path, kwargs):
+        # the image is read and oriented by the worker, the queue keeps at most 2 * workers of them in flight
+        get_save_image(ftype)(image.read(), name, file_path, **kwargs)
+
     def wait_for_signal(self):
         self.mutex.lock()
         self.condition.wait(self.mutex)
@@ -0,0 +1,89 @@
+import numpy as np
+
+from .global_vars import lazy_region_pixels
+from .utils import all_limits
+
+stats_windows = 8  # windows kept per image, the whole image and the last zoomed ones
+
+
+class ImageStats:
+    """Statistics of one window of an image, every value is computed on its first use and then kept.
+    Only the values are kept, the data is read again by read() when another value is needed, so the statistics
+    never hold arrays the image store wants to release.
+    """
+    def __init__(self, read):
+        self.read = read
+        self.values = {}
+
+    def _extremes(self):
+        if "min" not in self.values:
+            arr = self.read()
+            self.values["min"], self.values["max"] = arr.min(), arr.max()
+
+    def _moments(self):
+        if "mean" not in self.values:
+            arr = self.read()
+            self.values["mean"], self.values["std"] = arr.mean(), arr.std()
+
+    @property
+    def min(self):
+        self._extremes()
+        return self.values["min"]
+
+    @property
+    def max(self):
+        self._extremes()
+        return self.values["max"]
+
+    @property
+    def range(self):
+        return self.max - self.min
+
+    @property
+    def mean(self):
+        self._moments()
+        return self.values["mean"]
+
+    @property
+    def std(self):
+        self._moments()
+        return self.values["std"]
+
+    def histogram(self, bins):
+        """Returns the counts and the edges of the histogram of bins equal bins between min and max."""
+        key = ("histogram", bins)
+        if key not in self.values:
+            self.values[key] = np.histogram(self.read(), bins, range=(self.min, self.max))
+        return self.values[key]
+
+    def limits(self, index):
+        """Returns the vmin, vmax of the limits_dict preset index, all presets are computed together."""
+        if "limits" not in self.values:
+            self.values["limits"] = all_limits(self.read())
+            self.values["min"], self.values["max"] = self.values["limits"][0]
+        if index not in self.values["limits"]:
+            raise ValueError("Index out of range")
+        return self.values["limits"][index]
+
+
+def image_stats(image, zoom=False):
+    """Returns the cached statistics of the visible image, or of its zoomed region when zoom is True.
+    The cache of an image is cleared whenever its data is replaced.
+    """
+    y0, y1, x0, x1 = image.window(image.y_lim[1], image.y_lim[0], image.x_lim[0], image.x_lim[1])
+    if zoom:
+        # large windows of lazy frames are decimated like visible(), small ones and loaded images are read exactly
+        step = image.view_step()
+        key, read = (image.orientation, y0, y1, x0, x1, step), lambda: image.zoomed(step)
+    elif image.loaded or image.shape[0] * image.shape[1] <= lazy_region_pixels:
+        # the whole image, its statistics do not depend on the orientation
+        key, read = None, image.visible
+    else:  # only the zoomed region of a large lazy frame is visible, decimated by view_step()
+        key, read = (image.orientation, y0, y1, x0, x1, image.view_step()), image.visible
+    stats = image.stats_cache.pop(key, None)
+    if stats is None:
+        stats = ImageStats(read)
+    image.stats_cache[key] = stats  # the most recently used window is the last one
+    while len(image.stats_cache) > stats_windows:
+        del image.stats_cache[next(iter(image.stats_cache))]
+    return stats
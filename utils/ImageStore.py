@@ -0,0 +1,138 @@
+import itertools
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from .frames import CompressedFrame, memory_codecs
+from .global_vars import file_mapped
+
+
+class ImageStore(dict):
+    """Dict of ImageObjects keeping the arrays held in memory within a budget.
+
+    When the budget is exceeded, the least recently viewed images are, in this order:
+    - unloaded, if they were read from a lazy or a compressed frame, which is read again when needed,
+    - compressed in memory by the codec (if any), they are decompressed again on their next access,
+    - written to scratch files and replaced by copy-on-write memmaps of them.
+    Every user of the images keeps working unchanged. Images are marked as viewed by touch().
+    """
+    def __init__(self, budget=0, directory=None, codec="none"):
+        super().__init__()
+        self.budget = budget  # bytes, 0 means unlimited
+        self.codec = codec
+        self.directory = directory
+        self.incompressible = set()
+        self.order = OrderedDict()  # least recently viewed first
+        self.total = 0  # resident bytes as of the last change, arrays replaced by their users are found by enforce()
+        self.counter = itertools.count()
+
+    @staticmethod
+    def resident(image):
+        # memmaps of the loaded files and lazy frames do not occupy memory of their own
+        size = image._array.nbytes if image.loaded and not file_mapped(image._array) else 0
+        if isinstance(image.source, CompressedFrame):
+            size += image.source.compressed_nbytes
+        return size
+
+    def spilled(self, image):
+        return image.loaded and file_mapped(image._array) and self.directory is not None and \
+            os.path.dirname(os.path.abspath(image._array.filename)) == os.path.abspath(self.directory)
+
+    def __setitem__(self, im_id, image):
+        previous = self.get(im_id)
+        self.total += self.resident(image) - (self.resident(previous) if previous is not None else 0)
+        super().__setitem__(im_id, image)
+        self.order[im_id] = None
+        self.order.move_to_end(im_id)
+        if self.budget and self.total > self.budget:
+            self.enforce(keep=im_id)
+
+    def __delitem__(self, im_id):
+        self.pop(im_id)
+
+    def pop(self, im_id, *default):
+        self.order.pop(im_id, None)
+        self.incompressible.discard(im_id)
+        image = super().pop(im_id, *default)
+        if image is not None:
+            self.total -= self.resident(image)
+            if self.spilled(image):
+                self._remove(image._array.filename)
+        return image
+
+    def touch(self, im_id):
+        if im_id in self.order:
+            self.order.move_to_end(im_id)
+        self.enforce(keep=im_id)
+
+    def enforce(self, keep=None):
+        """Releases the least recently viewed arrays until the resident ones fit the budget, returns the bytes spilled."""
+        total = sum(self.resident(image) for image in self.values())
+        self.total = total
+        if not self.budget or total <= self.budget:
+            return 0
+        spilled = 0
+        # a bit more than necessary is released, so that not every following image rescans the store
+        limit = .9 * self.budget
+        for tier in ["unload", "compress", "spill"]:
+            for im_id in list(self.order):
+                if total <= limit:
+                    break
+                image = self.get(im_id)
+                size = self.resident(image) if image is not None else 0
+                if im_id == keep or size == 0:
+                    continue
+                if tier == "unload" and image.loaded and image.source is not None:
+                    # the arrays are replaced, never changed in place, so the frame still holds the same data
+                    image._array = None
+                elif tier == "compress" and self.codec in memory_codecs and im_id not in self.incompressible and \
+                        image.source is None and image.loaded and not file_mapped(image._array):
+                    frame = CompressedFrame(image._array, self.codec)
+                    if frame.compressed_nbytes > .9 * frame.nbytes:
+                        self.incompressible.add(im_id)
+                        continue
+                    image.raw = frame
+                elif tier == "spill":
+                    self.spill(image)
+                    spilled += size
+                else:
+                    continue
+                total += self.resident(image) - size
+        self.total = total
+        return spilled
+
+    def spill(self, image):
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="zajex-spill-")
+        # a new name for every spill, the previous file may still be mapped by a view of the old array
+        path = os.path.join(self.directory, f"{image.id_}_{next(self.counter)}.npy")
+        np.save(path, image._array if image.loaded else image.source.read())
+        image.raw = np.load(path, mmap_mode='c')
+
+    def usage(self, im_ids):
+        """Returns the resident, the compressed (part of the resident) and the spilled bytes of the images."""
+        resident, compressed, spilled = 0, 0, 0
+        for im_id in im_ids:
+            image = self.get(im_id)
+            if image is None:
+                continue
+            resident += self.resident(image)
+            if isinstance(image.source, CompressedFrame):
+                compressed += image.source.compressed_nbytes
+            if self.spilled(image):
+                spilled += image._array.nbytes
+        return resident, compressed, spilled
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:  # still mapped on Windows, removed with the directory at the latest
+            pass
+
+    def close(self):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
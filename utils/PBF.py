@@ -0,0 +1,63 @@
+import os
+import re
+
+from .frames import MemmapFrame
+
+# PBF frames are stored without padding one after another, their layout is described by the
+# Pixet descriptor saved next to the data as <file>.pbf.dsc:
+#   B000000002                                       <- format (A - ascii, B - binary) and number of frames
+#   [F0]
+#   Type=u16 [X,Y] width=256 height=256             <- type and size of the frame
+#   "Acq time" ("Acquisition time [s]"):           <- frame metadata, ignored here
+#   double[1]
+#   0.100000
+#   [F1]
+#   ...
+dsc_types = {
+    "char": "uint8", "byte": "uint8", "u8": "uint8", "i8": "int8",
+    "u16": "uint16", "i16": "int16", "u32": "uint32", "i32": "int32",
+    "u64": "uint64", "i64": "int64", "float": "float32", "double": "float64",
+}
+dsc_frame_pattern = re.compile(r"Type=(\w+)\s*\[X,Y\]\s*width=(\d+)\s*height=(\d+)")
+
+
+def descriptor_path(path):
+    return path + ".dsc"
+
+
+def read_descriptor(path):
+    """Returns a list of (dtype, (height, width)) for every frame described in the descriptor of the file."""
+    with open(descriptor_path(path), 'r', errors='ignore') as f:
+        first = f.readline().strip()
+        if not first or first[0] not in "AB":
+            raise ValueError(f"Unknown PBF descriptor format \"{first}\"")
+        if first[0] != "B":
+            raise ValueError("Only binary PBF frames are supported")
+        amount = int(first[1:] or 1)
+        frames = []
+        for match in dsc_frame_pattern.finditer(f.read()):
+            dtype = dsc_types.get(match.group(1).lower())
+            if dtype is None:
+                raise ValueError(f"Unsupported PBF frame type \"{match.group(1)}\"")
+            frames.append((dtype, (int(match.group(3)), int(match.group(2)))))
+    if not frames:
+        raise ValueError("No frames described in the PBF descriptor")
+    if len(frames) == 1 and amount > 1:  # frames of one series share a single description
+        frames = frames * amount
+    return frames[:amount]
+
+
+def load_frames(path, mmap=False):
+    """Returns one lazy frame per image of the file, located by offset arithmetic from its descriptor."""
+    frames = []
+    offset = 0
+    size = os.path.getsize(path)
+    for dtype, shape in read_descriptor(path):
+        frame = MemmapFrame(path, offset, shape, dtype, copy=not mmap)
+        if offset + frame.nbytes > size:
+            break
+        frames.append(frame)
+        offset += frame.nbytes
+    if not frames:
+        raise ValueError(f"\"{path}\" is smaller than its descriptor states")
+    return frames
@@ -0,0 +1,215 @@
+import json
+import os
+import shutil
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Zarr v2 directory store: <name>.zarr/.zarray holds the metadata, every chunk is a zlib stream stored in a file
+# named by its grid position, e.g. "3.0.0". Edge chunks are padded to the full chunk shape, as Zarr requires,
+# so the stores are readable by zarr/numcodecs as well.
+zarr_compression_level = 3
+zarr_chunk_bytes = 2 ** 20
+zarr_chunk_frames = 4
+
+
+def chunk_shape(shape, dtype, target=zarr_chunk_bytes):
+    """Chunks of (frames, rows, columns) holding square tiles of zarr_chunk_frames frames. Reading one frame
+    decompresses only those few frames, reading one sinogram (the same row of all frames) one band of tiles.
+    """
+    height, width = shape[-2:]
+    itemsize = np.dtype(dtype).itemsize
+    if len(shape) == 2:
+        side = max(1, int(np.sqrt(target / (width * itemsize))))
+        return min(side * side, height), width
+    depth = min(zarr_chunk_frames, shape[0])
+    side = max(1, int(np.sqrt(target / (depth * itemsize))))
+    return depth, min(side, height), min(side, width)
+
+
+class ZarrStore:
+    """Lazily read Zarr v2 array of one frame (2D) or of a stack of frames (3D)."""
+    _executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+    _cache = OrderedDict()  # decompressed chunks shared by all stores, least recently used first
+    _cache_size = 0
+    _cache_limit = 256 * 2 ** 20
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        # the array may have been rewritten since it was opened last time
+        ZarrStore.forget(self.path)
+        with open(os.path.join(path, ".zarray"), 'r') as f:
+            meta = json.load(f)
+        if meta.get("zarr_format") != 2 or meta.get("order", "C") != "C" or meta.get("filters"):
+            raise ValueError(f"\"{path}\" is not a supported Zarr array")
+        compressor = meta.get("compressor")
+        if compressor is not None and compressor.get("id") != "zlib":
+            raise ValueError(f"Unsupported Zarr compressor \"{compressor.get('id')}\"")
+        self.compressed = compressor is not None
+        self.shape = tuple(meta["shape"])
+        self.chunks = tuple(meta["chunks"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.fill_value = meta.get("fill_value") or 0
+        self.separator = meta.get("dimension_separator", ".")
+        if len(self.shape) == 2:  # a single frame is handled as a stack of one
+            self.shape, self.chunks = (1, *self.shape), (1, *self.chunks)
+            self.flat = True
+        elif len(self.shape) == 3:
+            self.flat = False
+        else:
+            raise ValueError(f"Zarr array of shape {self.shape} is not an image or a stack of images")
+        # a frame is read with the whole depth of its chunks, these have to fit the cache together with the chunks
+        # of the next frames, otherwise paging through the frames (e.g. by deeper chunks of other writers) never hits
+        cn, ch, cw = self.chunks
+        block = cn * -(-self.shape[1] // ch) * ch * -(-self.shape[2] // cw) * cw * self.dtype.itemsize
+        with ZarrStore._lock:
+            ZarrStore._cache_limit = max(ZarrStore._cache_limit, 2 * block)
+
+    @classmethod
+    def forget(cls, path):
+        """Drops the cached chunks of the array at path, e.g. when it is rewritten."""
+        path = os.path.abspath(path)
+        with cls._lock:
+            for cache_key in [k for k in cls._cache if k[0] == path]:
+                cls._cache_size -= cls._cache.pop(cache_key).nbytes
+
+    def _chunk(self, key):
+        cache_key = (self.path, key)
+        with ZarrStore._lock:
+            chunk = ZarrStore._cache.get(cache_key)
+            if chunk is not None:
+                ZarrStore._cache.move_to_end(cache_key)
+                return chunk
+        name = self.separator.join(str(i) for i in (key[1:] if self.flat else key))
+        try:
+            with open(os.path.join(self.path, name), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:  # chunks holding only the fill value do not have to be stored
+            chunk = np.full(self.chunks, self.fill_value, self.dtype)
+        else:
+            chunk = np.frombuffer(zlib.decompress(data) if self.compressed else data, self.dtype).reshape(self.chunks)
+        with ZarrStore._lock:
+            if cache_key not in ZarrStore._cache:
+                ZarrStore._cache[cache_key] = chunk
+                ZarrStore._cache_size += chunk.nbytes
+            while ZarrStore._cache_size > ZarrStore._cache_limit and len(ZarrStore._cache) > 1:
+                ZarrStore._cache_size -= ZarrStore._cache.popitem(last=False)[1].nbytes
+        return chunk
+
+    def read(self, index, y0, y1, x0, x1, step=1):
+        """Returns rows y0:y1:step and columns x0:x1:step of the frame, its chunks are decompressed in parallel."""
+        cn, ch, cw = self.chunks
+        out = np.empty((len(range(y0, y1, step)), len(range(x0, x1, step))), self.dtype)
+        if out.size == 0:
+            return out
+        keys = [(index // cn, cy, cx) for cy in range(y0 // ch, -(-y1 // ch)) for cx in range(x0 // cw, -(-x1 // cw))]
+        for (_, cy, cx), chunk in zip(keys, ZarrStore._executor.map(self._chunk, keys)):
+            # rows and columns of the chunk inside the region that lie on the step grid
+            top, left = max(y0, cy * ch), max(x0, cx * cw)
+            top, left = top + (y0 - top) % step, left + (x0 - left) % step
+            bottom, right = min(y1, (cy + 1) * ch), min(x1, (cx + 1) * cw)
+            if top < bottom and left < right:
+                out[(top - y0) // step:(bottom - y0 + step - 1) // step,
+                    (left - x0) // step:(right - x0 + step - 1) // step] = \
+                    chunk[index % cn, top - cy * ch:bottom - cy * ch:step, left - cx * cw:right - cx * cw:step]
+        return out
+
+    def frames(self):
+        return [ZarrFrame(self, i) for i in range(self.shape[0])]
+
+
+class ZarrFrame:
+    """Frame of a Zarr array, only the chunks of the requested region are decompressed."""
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        self.shape = store.shape[1:]
+        self.dtype = store.dtype
+
+    @property
+    def nbytes(self):
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    def read(self):
+        return self.store.read(self.index, 0, self.shape[0], 0, self.shape[1])
+
+    def region(self, y0, y1, x0, x1, step=1):
+        return self.store.read(self.index, y0, y1, x0, x1, step)
+
+
+class ZarrWriter:
+    """Writes a stack frame by frame, every block of chunk-deep frames is compressed in parallel and released.
+    ZarrWriter(path, shape, dtype, amount, chunks=None, maxworkers=None)
+    shape = (height, width) of the frames
+    amount = number of frames, the stored shape is reduced on close if fewer frames were written
+    """
+    def __init__(self, path, shape, dtype, amount, chunks=None, maxworkers=None):
+        self.path = path
+        self.shape = (max(1, amount), *shape)
+        self.dtype = np.dtype(dtype)
+        self.chunks = tuple(chunks) if chunks is not None else chunk_shape(self.shape, self.dtype)
+        self.maxworkers = maxworkers or os.cpu_count()
+        self.block = np.zeros(self.chunks[:1] + tuple(shape), self.dtype)
+        self.amount = 0
+        if os.path.exists(os.path.join(path, ".zarray")):  # chunks of the replaced array must not survive
+            shutil.rmtree(path)
+        ZarrStore.forget(path)
+        os.makedirs(path, exist_ok=True)
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            "zarr_format": 2,
+            "shape": list(self.shape),
+            "chunks": list(self.chunks),
+            "dtype": self.dtype.str,
+            "compressor": {"id": "zlib", "level": zarr_compression_level},
+            "fill_value": 0,
+            "order": "C",
+            "filters": None,
+        }
+        with open(os.path.join(self.path, ".zarray"), 'w') as f:
+            json.dump(meta, f, indent=4)
+
+    def _write_chunk(self, key):
+        cn, ch, cw = self.chunks
+        chunk = np.zeros(self.chunks, self.dtype)  # edge chunks are padded to the full shape
+        data = self.block[:, key[1] * ch:(key[1] + 1) * ch, key[2] * cw:(key[2] + 1) * cw]
+        chunk[:, :data.shape[1], :data.shape[2]] = data
+        with open(os.path.join(self.path, ".".join(str(i) for i in key)), 'wb') as f:
+            f.write(zlib.compress(chunk.tobytes(), zarr_compression_level))
+
+    def _flush(self):
+        cn, ch, cw = self.chunks
+        keys = [((self.amount - 1) // cn, cy, cx)
+                for cy in range(-(-self.shape[1] // ch)) for cx in range(-(-self.shape[2] // cw))]
+        with ThreadPoolExecutor(max_workers=self.maxworkers) as executor:
+            list(executor.map(self._write_chunk, keys))
+        self.block[...] = 0
+
+    def write(self, frame):
+        if frame.shape != self.shape[1:]:
+            raise ValueError(f"Frame of shape {frame.shape} does not fit the stack of {self.shape[1:]}")
+        if self.amount >= self.shape[0]:
+            self.shape = (self.amount + 1, *self.shape[1:])
+        self.block[self.amount % self.chunks[0]] = frame
+        self.amount += 1
+        if self.amount % self.chunks[0] == 0:
+            self._flush()
+
+    def close(self):
+        if self.amount % self.chunks[0] != 0:
+            self._flush()
+        self.shape = (max(1, self.amount), *self.shape[1:])
+        self._write_meta()
+        ZarrStore.forget(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
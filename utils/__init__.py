@@ -1,4 +1,10 @@
 from .global_vars import *
 from .ImageSaverThread import ImageSaverThread
 from .ImageLoaderThread import ImageLoaderThread
+from .FolderWatcherThread import FolderWatcherThread, watch_orders
+from .HeaderCatalog import HeaderCatalog, catalog_fields
+from .CatalogScanThread import CatalogScanThread
+from .ImageStore import ImageStore
+from .ImageStats import ImageStats, image_stats
+from .frames import TiffPageFrame
 from .utils import *
\ No newline at end of file
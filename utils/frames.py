@@ -0,0 +1,182 @@
+import threading
+import zlib
+
+import numpy as np
+import tifffile
+
+try:
+    import imagecodecs
+except ImportError:  # only the zlib codec of the compressed image tier is available
+    imagecodecs = None
+
+memory_codecs = {"zlib": (lambda data: zlib.compress(data, 1), zlib.decompress)}
+if imagecodecs is not None:
+    memory_codecs["lz4"] = (imagecodecs.lz4_encode, imagecodecs.lz4_decode)
+    memory_codecs["zstd"] = (lambda data: imagecodecs.zstd_encode(data, level=1), imagecodecs.zstd_decode)
+
+
+def readinto(f, arr):
+    """Fills the contiguous array from the current position of the unbuffered file."""
+    view = memoryview(arr).cast('B')
+    while view:
+        n = f.readinto(view)
+        if not n:
+            raise EOFError(f"\"{f.name}\" ended before the requested data")
+        view = view[n:]
+
+
+def read_region(filepath, offset, shape, dtype, y0, y1, x0, x1, step=1):
+    """Reads rows y0:y1:step and columns x0:x1:step of an uncompressed frame stored at the offset of the file.
+    Only the rows of the region are read, each as one span of columns, the rest of the file is skipped by seeking.
+    """
+    dtype = np.dtype(dtype)
+    width = shape[1]
+    rows = range(y0, y1, step)
+    out = np.empty((len(rows), len(range(x0, x1, step))), dtype)
+    if out.size == 0:
+        return out
+    with open(filepath, 'rb', buffering=0) as f:
+        if step == 1 and x1 - x0 == width:  # whole rows are one contiguous block
+            f.seek(offset + y0 * width * dtype.itemsize)
+            readinto(f, out)
+        elif step == 1:
+            for i, y in enumerate(rows):
+                f.seek(offset + (y * width + x0) * dtype.itemsize)
+                readinto(f, out[i])
+        else:
+            line = np.empty(x1 - x0, dtype)
+            for i, y in enumerate(rows):
+                f.seek(offset + (y * width + x0) * dtype.itemsize)
+                readinto(f, line)
+                out[i] = line[::step]
+    return out
+
+
+class MemmapFrame:
+    """Frame stored uncompressed at a fixed offset of a file, read through a memmap of just that frame."""
+    def __init__(self, filepath, offset, shape, dtype, copy=True):
+        self.filepath = filepath
+        self.offset = offset
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.copy = copy
+
+    @property
+    def nbytes(self):
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    def _map(self):
+        return np.memmap(self.filepath, dtype=self.dtype, mode='r', offset=self.offset, shape=self.shape)
+
+    def read(self):
+        return np.array(self._map()) if self.copy else self._map()
+
+    def region(self, y0, y1, x0, x1, step=1):
+        return read_region(self.filepath, self.offset, self.shape, self.dtype, y0, y1, x0, x1, step)
+
+
+class TiffPageFrame:
+    """Single page of a multi-page TIFF file, decoded only when it is read."""
+    _files = {}
+    _lock = threading.RLock()
+
+    def __init__(self, filepath, index, shape, dtype):
+        self.filepath = filepath
+        self.index = index
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def nbytes(self):
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            for tif in cls._files.values():
+                tif.close()
+            cls._files.clear()
+
+    def _page(self):
+        # one shared handle per file, so the page offsets are parsed only once per stack
+        tif = TiffPageFrame._files.get(self.filepath)
+        if tif is None:
+            tif = TiffPageFrame._files[self.filepath] = tifffile.TiffFile(self.filepath)
+        return tif.pages[self.index]
+
+    def read(self):
+        with TiffPageFrame._lock:
+            return self._page().asarray()
+
+    def region(self, y0, y1, x0, x1, step=1):
+        """Decodes only the strips or tiles intersecting rows y0:y1 and columns x0:x1, keeping every step-th pixel."""
+        with TiffPageFrame._lock:
+            page = self._page()
+            if page.is_tiled:
+                seg_h, seg_w = page.tilelength, page.tilewidth
+            else:
+                seg_h, seg_w = page.rowsperstrip or page.imagelength, page.imagewidth
+            if page.samplesperpixel > 1 or len(page.dataoffsets) == 1:
+                return page.asarray()[y0:y1:step, x0:x1:step]
+
+            per_row = -(-page.imagewidth // seg_w)
+            out = np.zeros((y1 - y0, x1 - x0), self.dtype)
+            fh = page.parent.filehandle
+            for row in range(y0 // seg_h, -(-y1 // seg_h)):
+                for col in range(x0 // seg_w, -(-x1 // seg_w)):
+                    index = row * per_row + col
+                    fh.seek(page.dataoffsets[index])
+                    data = fh.read(page.databytecounts[index])
+                    segment, (_, _, y, x, _), shape = page.decode(data, index, jpegtables=page.jpegtables)
+                    segment = segment.reshape(shape[1], shape[2])
+                    top, bottom = max(y, y0), min(y + shape[1], y1)
+                    left, right = max(x, x0), min(x + shape[2], x1)
+                    if top < bottom and left < right:
+                        out[top - y0:bottom - y0, left - x0:right - x0] = segment[top - y:bottom - y,
+                                                                                  left - x:right - x]
+            return out[::step, ::step]
+
+
+def tiff_frames(filepath):
+    """Returns the pages of a multi-page grayscale TIFF as lazy frames, or None for single images."""
+    with TiffPageFrame._lock:
+        tif = tifffile.TiffFile(filepath)
+        page = tif.pages[0]
+        if len(tif.pages) < 2 or page.samplesperpixel > 1 or len(page.shape) != 2:
+            tif.close()
+            return None
+        old = TiffPageFrame._files.pop(filepath, None)
+        if old is not None:
+            old.close()
+        TiffPageFrame._files[filepath] = tif
+        return [TiffPageFrame(filepath, i, page.shape, page.dtype) for i in range(len(tif.pages))]
+
+
+class CompressedFrame:
+    """Image kept losslessly compressed in memory, decompressed whenever it is read."""
+    def __init__(self, array, codec="lz4"):
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.codec = codec
+        data = np.ascontiguousarray(array).view(np.uint8)
+        if self.dtype.itemsize > 1:  # bytes of the same significance next to each other compress much better
+            data = np.ascontiguousarray(data.reshape(-1, self.dtype.itemsize).T)
+        self.data = memory_codecs[codec][0](data)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    @property
+    def compressed_nbytes(self):
+        return len(self.data)
+
+    def read(self):
+        data = np.frombuffer(memory_codecs[self.codec][1](self.data), np.uint8)
+        if self.dtype.itemsize > 1:
+            data = data.reshape(self.dtype.itemsize, -1).T
+        # a writable copy, like the arrays of the other frames
+        return np.array(data, order='C').view(self.dtype).reshape(self.shape)
+
+    def region(self, y0, y1, x0, x1, step=1):
+        return self.read()[y0:y1:step, x0:x1:step]
@@ -1,8 +1,10 @@
+import os
 from dataclasses import dataclass
 import numpy as np
 
-supportedLoadFormats = ['bin', 'raw', 'txt', 'tif', 'jpg', 'png', 'pbf']
-supportedSaveFormats = ['tif', 'raw', 'bin', 'txt', 'jpg', 'png']
+supportedLoadFormats = ['bin', 'raw', 'txt', 'tif', 'jpg', 'png', 'pbf', 'zarr']
+supportedSaveFormats = ['tif', 'raw', 'bin', 'txt', 'jpg', 'png', 'zarr']
+supportedStackFormats = ['tif', 'raw', 'zarr']  # formats storing many images in one file
 save_formats_strings = {
     "raw": "EZRT raw file, version 2.5.0 (*.raw)",
     "bin": "Binary file (*.bin)",
@@ -11,6 +13,7 @@ save_formats_strings = {
     "jpg": "JPEG image file (*.jpg)",
     "png": "PNG file (*.png)",
     "pbf": "PBF image file (*.pbf)",
+    "zarr": "Zarr chunked array (*.zarr)",
 }
 supportedDataTypes = ['int8', 'int16', 'int32', 'int64',
                       'uint8', 'uint16', 'uint32', 'uint64',
@@ -31,6 +34,9 @@ supportedDataTypesByFileType = {
     "txt": ['int8', 'int16', 'int32', 'int64',
             'uint8', 'uint16', 'uint32', 'uint64',
             'float8', 'float16', 'float32', 'float64'],
+    "zarr": ['int8', 'int16', 'int32', 'int64',
+             'uint8', 'uint16', 'uint32', 'uint64',
+             'float16', 'float32', 'float64'],
 }
 
 limits_dict = {0: "min - max",
@@ -56,10 +62,26 @@ lFileTypeString = """
             PNG file (*.png);;
             JPG image (*.jpg);;
             TIFF file (*.tiff);;
+            PBF image file (*.pbf);;
+            Zarr chunked array (*.zarr);;
             All files (*.*)
             """
 rotation_list = ["0°", "90°", "180°", "270°"]
 
+loader_pools = ["thread", "process"]
+tiff_compressions = ["none", "zlib", "zstd", "lzw"]  # zstd and lzw are encoded by imagecodecs
+tiff_tile_size = 256
+bigtiff_threshold = 2 ** 32 - 2 ** 26  # classic TIFF offsets are 32-bit, some room is left for the page headers
+lazy_region_pixels = 8192 * 8192
+cache_directory = os.path.join(os.path.expanduser("~"), ".zajex", "cache")
+geometry_profiles_path = os.path.join(os.path.expanduser("~"), ".zajex", "geometry_profiles.json")
+header_catalog_path = os.path.join(os.path.expanduser("~"), ".zajex", "header_catalog.sqlite")
+
+# (rows, columns) of the detector frames, including the binning modes of XRD1611 and XRD1622
+detector_shapes = [(4096, 4096), (2048, 2048), (1024, 1024), (512, 512),
+                   (2048, 4096), (1024, 4096), (1024, 2048), (512, 2048)]
+detector_dtypes = ['uint16', 'float32']
+
 item_type = "application/x-qabstractitemmodeldatalist"
 
 
@@ -86,17 +108,155 @@ class Parameters:
     num_bins: int = 30
     ratio: float = 1 / np.e
     tiff_bit_depth: str = str(np.uint16)
+    loader_workers: int = 1
+    loader_pool: str = "thread"
+    saver_workers: int = 1
+    tiff_compression: str = "none"
+    tiff_tiled: bool = False
+    memory_budget: int = 0  # MB, 0 = unlimited
+    memory_codec: str = "none"  # compression of the images above the budget before they are spilled
+    memmap: bool = False
+    watch_order: str = "natural"
+    cache: bool = False
+    cache_dir: str = cache_directory
+    cache_size: int = 8192  # MB
+    catalog_order: str = "Meas.nProjectionNo"
+
+
+def file_mapped(array):
+    """True if the array is a memmap of a file, memmaps received from other processes are copies without a file."""
+    return isinstance(array, np.memmap) and array.filename is not None
+
+
+def orient(array, orientation):
+    """Returns a view of the array turned by orientation = (quarter turns counterclockwise, mirrored left-right first)."""
+    turns, mirrored = orientation
+    return np.rot90(array[:, ::-1] if mirrored else array, turns)
+
+
+def compose_orientation(orientation, turns=0, flip_ud=False, flip_lr=False):
+    """Orientation of the image that is further rotated by turns, then flipped (flips are done on the oriented image)."""
+    k, mirrored = orientation[0] + turns, orientation[1]
+    # fliplr(rot90(a, k)) == rot90(fliplr(a), -k) and flipud(b) == rot90(fliplr(b), 2)
+    if flip_lr:
+        k, mirrored = -k, not mirrored
+    if flip_ud:
+        k, mirrored = 2 - k, not mirrored
+    return k % 4, mirrored
 
 
-@dataclass
 class ImageObject:
-    array: np.ndarray
-    vmin: float
-    vmax: float
-    x_lim: tuple
-    y_lim: tuple
-    id_: int
-    filepath: str
-    mirror_UD: bool = False
-    mirror_LR: bool = False
-    rotation: int = 0
\ No newline at end of file
+    def __init__(self, array, vmin, vmax, x_lim: tuple, y_lim: tuple, id_: int, filepath: str,
+                 mirror_UD: bool = False, mirror_LR: bool = False, rotation: int = 0):
+        # array is either a numpy array or a lazy frame (utils.frames) that is read on first access
+        self._array = None
+        self.source = None
+        self.raw = array
+        # the data is kept as loaded, the orientation is applied to the views shown and to the arrays handed out
+        self.orientation = (0, False)
+        self.stats_cache = {}  # ImageStats by window, see utils.ImageStats
+        self.vmin = vmin
+        self.vmax = vmax
+        self.x_lim = x_lim
+        self.y_lim = y_lim
+        self.id_ = id_
+        self.filepath = filepath
+        self.mirror_UD = mirror_UD
+        self.mirror_LR = mirror_LR
+        self.rotation = rotation
+
+    @property
+    def raw(self):
+        """The data in the orientation it was loaded in, setting it only changes where the same data is kept."""
+        if self._array is None and self.source is not None:
+            self._array = self.source.read()
+        return self._array
+
+    @raw.setter
+    def raw(self, array):
+        if isinstance(array, np.ndarray) or array is None:
+            self.source, self._array = None, array
+        else:
+            self.source, self._array = array, None
+
+    @property
+    def array(self):
+        """The data in its orientation, rotated or mirrored images are copied in one pass into a new array."""
+        array = self.raw
+        if array is None or self.orientation == (0, False):
+            return array
+        return np.ascontiguousarray(orient(array, self.orientation))
+
+    def read(self, oriented=True):
+        """Like array, but a frame that is not loaded is read without being kept, e.g. to stream it to a file.
+        With oriented=False the data is returned as loaded, without a copy of loaded images.
+        """
+        if self.loaded or self.source is None:
+            return self.array if oriented else self.raw
+        array = self.source.read()
+        if not oriented or self.orientation == (0, False):
+            return array
+        return np.ascontiguousarray(orient(array, self.orientation))
+
+    @array.setter
+    def array(self, array):
+        self.raw = array
+        self.orientation = (0, False)
+        self.stats_cache.clear()
+
+    @property
+    def shape(self):
+        shape = self._array.shape if self._array is not None else self.source.shape
+        return shape[::-1] if self.orientation[0] % 2 else shape
+
+    def reorient(self, turns=0, flip_ud=False, flip_lr=False):
+        self.orientation = compose_orientation(self.orientation, turns, flip_ud, flip_lr)
+
+    @property
+    def loaded(self):
+        return self._array is not None
+
+    def window(self, y0, y1, x0, x1):
+        """Returns the pixel bounds y0, y1, x0, x1 of the window inside the image."""
+        y0, y1 = max(0, int(min(y0, y1) + .5)), min(self.shape[0], int(max(y0, y1) + .5))
+        x0, x1 = max(0, int(min(x0, x1) + .5)), min(self.shape[1], int(max(x0, x1) + .5))
+        return y0, y1, x0, x1
+
+    def region(self, y0, y1, x0, x1, step=1):
+        y0, y1, x0, x1 = self.window(y0, y1, x0, x1)
+        if self.loaded:
+            return orient(self._array, self.orientation)[y0:y1:step, x0:x1:step]
+        if self.orientation == (0, False):
+            return self.source.region(y0, y1, x0, x1, step)
+        if y0 >= y1 or x0 >= x1:
+            return np.empty((0, 0), self.source.dtype)
+        # the oriented views of the row and column index grids give the rows and columns of the source to read
+        shape = self.source.shape
+        rows = orient(np.broadcast_to(np.arange(shape[0])[:, None], shape), self.orientation)[y0:y1:step, x0:x1:step]
+        cols = orient(np.broadcast_to(np.arange(shape[1])[None, :], shape), self.orientation)[y0:y1:step, x0:x1:step]
+        r0, r1 = sorted((int(rows[0, 0]), int(rows[-1, -1])))
+        c0, c1 = sorted((int(cols[0, 0]), int(cols[-1, -1])))
+        return orient(self.source.region(r0, r1 + 1, c0, c1 + 1, step), self.orientation)
+
+    def zoomed(self, step=1):
+        return self.region(self.y_lim[1], self.y_lim[0], self.x_lim[0], self.x_lim[1], step)
+
+    def view_step(self):
+        # zoomed regions of unread frames larger than lazy_region_pixels are decimated to about that size
+        if self.loaded or self.shape[0] * self.shape[1] <= lazy_region_pixels:
+            return 1
+        pixels = abs(self.y_lim[0] - self.y_lim[1]) * abs(self.x_lim[1] - self.x_lim[0])
+        return max(1, int(np.ceil(np.sqrt(pixels / lazy_region_pixels))))
+
+    def visible(self):
+        # large pages that were not read yet are only decoded for the zoomed region
+        if self.loaded or self.shape[0] * self.shape[1] <= lazy_region_pixels:
+            return orient(self.raw, self.orientation)
+        return self.zoomed(self.view_step())
+
+    def is_mapped(self):
+        return not self.loaded or file_mapped(self._array)
+
+    def materialize(self):
+        if self.is_mapped():
+            self._array = np.array(self.raw)
@@ -1,7 +1,15 @@
 import os
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from PIL import Image
 import numpy as np
 import tifffile
+from .PBF import descriptor_path
+from .EZRT import Header, RawStackWriter
+from .ZarrStore import ZarrWriter
+from .global_vars import tiff_tile_size, bigtiff_threshold, detector_shapes, detector_dtypes, geometry_profiles_path
 
 
 def id_generator():
@@ -12,9 +20,13 @@ def id_generator():
 
 
 def validate_input(filepath, parameters):
+    if filepath.split(".")[-1] == "zarr":  # Zarr arrays are directories
+        return os.path.exists(os.path.join(filepath, ".zarray")) or None
     if not os.path.exists(filepath) or not os.path.isfile(filepath):
         return None
     ft = filepath.split(".")[-1]
+    if ft == "pbf" and os.path.exists(descriptor_path(filepath)):
+        return True
     if ft not in ["png", "jpg", "jpeg", 'txt', 'raw', 'tiff', 'tif']:
         size = os.path.getsize(filepath)
         if parameters.width > 0 and parameters.height > 0:
@@ -29,25 +41,95 @@ def validate_input(filepath, parameters):
         return True
 
 
+def infer_geometry(filepath, profiles):
+    """Returns the geometries (dtype, width, height and header) a headerless file may have judging by its size,
+    the most likely one first. The profile remembered for the directory of the file is the only one if it fits,
+    otherwise the known detector formats and square frames of other sizes are tried. More than one geometry
+    means the size is ambiguous, none that it is unknown.
+    """
+    size = os.path.getsize(filepath)
+
+    def fits(candidate):
+        frame = candidate["width"] * candidate["height"] * np.dtype(candidate["dtype"]).itemsize
+        return frame > 0 and size - frame == candidate["header"]
+
+    profile = profiles.get(os.path.dirname(filepath))
+    if profile is not None and fits(profile):
+        return [profile]
+    candidates = [{"dtype": dtype, "width": rows, "height": columns, "header": 0}
+                  for dtype in detector_dtypes for rows, columns in detector_shapes]
+    candidates = [candidate for candidate in candidates if fits(candidate)]
+    for dtype in detector_dtypes:  # square frames of other sizes
+        side = int(round((size / np.dtype(dtype).itemsize) ** .5))
+        candidate = {"dtype": dtype, "width": side, "height": side, "header": 0}
+        if fits(candidate) and candidate not in candidates:
+            candidates.append(candidate)
+    return candidates
+
+
+def load_geometry_profiles():
+    try:
+        with open(geometry_profiles_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_geometry_profiles(profiles):
+    os.makedirs(os.path.dirname(geometry_profiles_path), exist_ok=True)
+    with open(geometry_profiles_path, 'w') as f:
+        json.dump(profiles, f, indent=1)
+
+
 def save_jpg(mat, name, path, **kwargs):
-    mat = normalize_array(mat, kwargs["dtype"])
+    mat = normalize_array(mat, kwargs["dtype"], kwargs.get("value_range"))
     im = Image.fromarray(mat)
     im.save(f"{path}/{name}.jpg")
 
 
 def save_png(mat, name, path, **kwargs):
-    mat = normalize_array(mat, kwargs["dtype"])
+    mat = normalize_array(mat, kwargs["dtype"], kwargs.get("value_range"))
     im = Image.fromarray(mat)
     im.save(f"{path}/{name}.png")
 
 
+def tif_options(**kwargs):
+    # tiles and strips are compressed in parallel by tifffile, tiles also allow cheap partial reads
+    options = {"maxworkers": kwargs.get("maxworkers")}
+    compression = kwargs.get("compression", "none")
+    if compression != "none":
+        options["compression"] = compression
+        options["predictor"] = True  # horizontal differencing for integers, floating point predictor for floats
+    if kwargs.get("tiled", False):
+        options["tile"] = (tiff_tile_size, tiff_tile_size)
+    return options
+
+
 def save_tif(mat, name, path, **kwargs):
-    mat = normalize_array(mat, kwargs["dtype"])
-    tifffile.imwrite(f"{path}/{name}.tif", mat, photometric='minisblack')
+    mat = normalize_array(mat, kwargs["dtype"], kwargs.get("value_range"))
+    tifffile.imwrite(f"{path}/{name}.tif", mat, photometric='minisblack', **tif_options(**kwargs))
+
+
+def save_tif_stack(mats, name, path, **kwargs):
+    # mats may be any iterable, so only the page being written is kept in memory
+    mats = iter(mats)
+    mat = next(mats, None)
+    if mat is None:
+        return
+    mat = normalize_array(mat, kwargs["dtype"], kwargs.get("value_range"))
+    # the uncompressed size bounds the file size, BigTIFF is used also when the number of pages is unknown
+    amount = kwargs.get("amount", 0)
+    bigtiff = amount == 0 or mat.nbytes * amount > bigtiff_threshold
+    with tifffile.TiffWriter(f"{path}/{name}.tif", bigtiff=bigtiff) as tif:
+        while mat is not None:
+            tif.write(mat, photometric='minisblack', metadata=None, **tif_options(**kwargs))
+            mat = next(mats, None)
+            if mat is not None:
+                mat = normalize_array(mat, kwargs["dtype"], kwargs.get("value_range"))
 
 
 def save_raw(mat, name, path, **kwargs):
-    mat = normalize_array(mat, kwargs["dtype"])
+    mat = normalize_array(mat, kwargs["dtype"], kwargs.get("value_range"))
     header = kwargs["header"]
     header_packed = header.getPacked()[1]
 
@@ -56,20 +138,166 @@ def save_raw(mat, name, path, **kwargs):
         f.write(np.ascontiguousarray(mat))
 
 
+def save_raw_stack(mats, name, path, **kwargs):
+    # mats may be any iterable, so only the frame being written is kept in memory
+    writer = None
+    try:
+        for mat in mats:
+            mat = normalize_array(mat, kwargs["dtype"], kwargs.get("value_range"))
+            if writer is None:
+                writer = RawStackWriter(f"{path}/{name}.raw", kwargs.get("header", Header()), mat.shape, mat.dtype,
+                                        amount=kwargs.get("amount", 0))
+            writer.write(mat)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def save_zarr_stack(mats, name, path, **kwargs):
+    # mats may be any iterable, only one chunk-deep block of frames is kept in memory
+    writer = None
+    try:
+        for mat in mats:
+            mat = normalize_array(mat, kwargs["dtype"], kwargs.get("value_range"))
+            if writer is None:
+                writer = ZarrWriter(f"{path}/{name}.zarr", mat.shape, mat.dtype, kwargs.get("amount", 1),
+                                    maxworkers=kwargs.get("maxworkers"))
+            writer.write(mat)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def save_zarr(mat, name, path, **kwargs):
+    save_zarr_stack([mat], name, path, **dict(kwargs, amount=1))
+
+
+def format_block(block: np.array, precision: int = None) -> bytes:
+    """Formats the rows of a 2D block as np.savetxt does with '%d' (precision None) or '%.<precision>f'.
+    Every value gets a right-aligned field in a byte matrix, numpy writes one decimal place of all values
+    at a time and the zero bytes left in front of the shorter values are dropped at the end.
+    """
+    rows, columns = block.shape
+    if precision is None:
+        if block.dtype == np.uint64:
+            magnitude, negative = block.reshape(-1), np.zeros(block.size, bool)
+        else:
+            values = block.reshape(-1).astype(np.int64)
+            magnitude, negative = np.abs(values).astype(np.uint64), values < 0
+        precision = 0
+    else:
+        values = block.reshape(-1).astype(np.float64)
+        scaled = values * 10. ** precision
+        if not np.isfinite(scaled).all() or np.abs(scaled).max(initial=0) >= 2 ** 52:
+            row = " ".join([f"%.{precision}f"] * columns) + "\n"
+            return ((row * rows) % tuple(values.tolist())).encode()
+        rounded = np.rint(scaled)
+        if np.finfo(block.dtype).nmant + 1 + np.ceil(precision * np.log2(5)) > 53:
+            # the product may be inexact, values too close to a rounding boundary are rounded by Python
+            boundary = np.abs(np.abs(scaled - np.trunc(scaled)) - .5) <= np.abs(scaled) * 2.3e-16
+            for i in np.flatnonzero(boundary):
+                rounded[i] = float((f"%.{precision}f" % values[i]).replace(".", ""))
+        magnitude, negative = np.abs(rounded).astype(np.uint64), np.signbit(values)
+
+    max_digits = max(len(str(int(magnitude.max(initial=0)))), precision + 1)
+    width = max_digits + (precision > 0) + bool(negative.any())
+    field = np.zeros((magnitude.size, width + 1), np.uint8)
+    remaining = magnitude.astype(np.uint32) if max_digits < 10 else magnitude.copy()
+    ten = remaining.dtype.type(10)
+    quotient, digit = np.empty_like(remaining), np.empty_like(remaining)
+    # floats always have a digit before the decimal point
+    length = np.full(magnitude.size, precision + 1 + (precision > 0), np.uint8)
+    for k in range(max_digits):
+        np.divmod(remaining, ten, out=(quotient, digit))
+        digit += ord("0")
+        if k > precision:  # leading zeros stay zero bytes
+            significant = remaining > 0
+            digit *= significant
+            length += significant
+        field[:, width - 1 - k - (precision > 0 and k >= precision)] = digit
+        remaining, quotient = quotient, remaining
+    if precision > 0:
+        field[:, width - 1 - precision] = ord(".")
+    if negative.any():
+        index = np.flatnonzero(negative)
+        field[index, width - 1 - length[index]] = ord("-")
+    field[:, width] = ord(" ")
+    field[columns - 1::columns, width] = ord("\n")
+    return field[field != 0].tobytes()
+
+
 def save_txt(mat, name, path, **kwargs):
-    mat = normalize_array(mat, kwargs["dtype"])
+    mat = normalize_array(mat, kwargs["dtype"], kwargs.get("value_range"))
     if np.issubdtype(mat.dtype, np.integer):
-        fmt = '%d'  # integer format
+        precision = None  # '%d'
     elif np.issubdtype(mat.dtype, np.floating):
-        fmt = '%.5f'  # float format to 5 decimal places
+        precision = 5  # '%.5f', 5 decimal places
     else:
         raise ValueError("Unsupported data type for array")
-    np.savetxt(f"{path}/{name}.txt", mat, fmt=fmt,
-               header=f"Numpy array of shape {mat.shape} of type {mat.dtype}")
+    header = f"# Numpy array of shape {mat.shape} of type {mat.dtype}\n"
+    mat = mat.reshape(len(mat), -1)
+    block_rows = max(1, 2 ** 18 // max(1, mat.shape[1]))
+    blocks = range(0, mat.shape[0], block_rows)
+    workers = kwargs.get("maxworkers") or os.cpu_count() or 1
+
+    with open(f"{path}/{name}.txt", 'wb') as f:
+        f.write(header.encode())
+        # the blocks are formatted in parallel and written in order, at most 2 * workers of them are kept
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i in range(0, len(blocks), 2 * workers):
+                for data in executor.map(lambda row: format_block(mat[row:row + block_rows], precision),
+                                         blocks[i:i + 2 * workers]):
+                    f.write(data)
+
+
+txt_header_pattern = re.compile(r"Numpy array of shape \(([\d,\s]+)\) of type (\w+)")
+
+
+def load_txt(filepath, dtype, block_values=2 ** 22):
+    shape = None
+    with open(filepath, 'r') as f:
+        line = f.readline()
+        while line.startswith("#"):
+            match = txt_header_pattern.search(line)
+            if match is not None:
+                shape = tuple(int(x) for x in match.group(1).split(",") if x.strip())
+                dtype = match.group(2)
+            line = f.readline()
+        if not line:
+            raise ValueError(f"No data in \"{filepath}\"")
+        dtype = np.dtype(dtype)
+        # float64 represents every value of the 32-bit and smaller types exactly
+        parse_dtype = dtype if dtype.itemsize == 8 else np.float64
+        columns = len(line.split())
+        if shape is not None and (len(shape) != 2 or shape[1] != columns):
+            raise ValueError(f"Header shape {shape} does not match the data in \"{filepath}\"")
+        block_rows = max(1, block_values // columns)
+
+        blocks = []
+        out = None if shape is None else np.empty(shape, dtype)
+        row = 0
+        lines = [line] + list(islice(f, block_rows - 1))
+        while lines:
+            block = np.fromstring("".join(lines), dtype=parse_dtype, sep=" ")
+            if block.size != len(lines) * columns:
+                raise ValueError(f"Rows {row} - {row + len(lines)} of \"{filepath}\" are malformed")
+            block = block.reshape(len(lines), columns)
+            if out is None:
+                blocks.append(block.astype(dtype, copy=False))
+            else:
+                out[row:row + len(lines)] = block
+            row += len(lines)
+            lines = list(islice(f, block_rows))
+
+    if out is None:
+        return np.concatenate(blocks)
+    if row != shape[0]:
+        raise ValueError(f"Expected {shape[0]} rows in \"{filepath}\", found {row}")
+    return out
 
 
 def save_bin(mat, name, path, **kwargs):
-    mat = normalize_array(mat, kwargs["dtype"])
+    mat = normalize_array(mat, kwargs["dtype"], kwargs.get("value_range"))
     mat.tofile(f"{path}/{name}.bin")
 
 
@@ -86,43 +314,146 @@ def get_save_image(filetype):
         return save_bin
     elif filetype == "txt":
         return save_txt
+    elif filetype == "zarr":
+        return save_zarr
 
 
-def normalize_array(array: np.array, dtype: np.dtype):
-    if np.issubdtype(dtype, np.integer):
-        dtype_max = np.iinfo(dtype).max
-        return ((array - array.min()) / (array.max() - array.min()) * dtype_max).astype(dtype)
-    else:
+def get_save_stack(filetype):
+    if filetype == "tif":
+        return save_tif_stack
+    elif filetype == "raw":
+        return save_raw_stack
+    elif filetype == "zarr":
+        return save_zarr_stack
+
+
+def array_range(array: np.array, block_values: int = 2 ** 18) -> tuple:
+    # min and max of each block are taken while it is still in the cache, i.e. one pass over the memory
+    flat = array.reshape(-1)
+    vmin, vmax = flat[0], flat[0]
+    for i in range(0, flat.size, block_values):
+        block = flat[i:i + block_values]
+        vmin, vmax = min(vmin, block.min()), max(vmax, block.max())
+    return vmin, vmax
+
+
+def batch_range(arrays, executor=None, read=None) -> tuple:
+    """Common (min, max) of several arrays, e.g. to scale all images of a batch the same way.
+    read(item) returns the array of each item of arrays, called by the workers, so only the arrays being ranged
+    are in memory at once.
+    """
+    def item_range(item):
+        return array_range(item if read is None else read(item))
+    ranges = list(executor.map(item_range, arrays) if executor is not None else map(item_range, arrays))
+    return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+
+def normalize_array(array: np.array, dtype: np.dtype, value_range: tuple = None, block_values: int = 2 ** 18):
+    """Scales the array to the full range of an integer dtype, other dtypes are returned unchanged.
+    value_range = (min, max) mapped to 0 and the dtype maximum, the range of the array if None,
+    values outside of it are clipped
+    The array is processed in blocks through a small float buffer straight into the output array.
+    """
+    if not np.issubdtype(dtype, np.integer):
         return array
+    dtype_max = np.iinfo(dtype).max
+    vmin, vmax = array_range(array, block_values) if value_range is None else value_range
+    out = np.empty(array.shape, dtype)
+    if array.size == 0 or vmax <= vmin:
+        out[...] = 0
+        return out
+
+    flat, flat_out = array.reshape(-1), out.reshape(-1)
+    # float arrays are scaled in their own precision unless the output needs more, integers in float64
+    work_dtype = np.float64
+    if np.issubdtype(array.dtype, np.floating) and np.dtype(dtype).itemsize <= 2:
+        work_dtype = array.dtype
+    buffer = np.empty(min(block_values, flat.size), work_dtype)
+    span = np.subtract(vmax, vmin, dtype=work_dtype)
+    for i in range(0, flat.size, block_values):
+        block = buffer[:flat[i:i + block_values].size]
+        np.subtract(flat[i:i + block_values], vmin, out=block, dtype=work_dtype)
+        np.divide(block, span, out=block)
+        np.multiply(block, dtype_max, out=block)
+        if value_range is not None:
+            np.clip(block, 0, dtype_max, out=block)
+        np.copyto(flat_out[i:i + block_values], block, casting='unsafe')
+    return out
+
+
+limits_percentiles = {1: (1, 99), 2: (5, 95), 3: (0.1, 99.9), 4: (0.01, 99.99), 5: (0.001, 99.999)}
+bincount_values = 2 ** 24  # integer arrays spanning at most this many values are counted instead of partitioned
+
+
+def order_statistics(arr: np.array, ks, block_values: int = 2 ** 20) -> np.array:
+    """Values at the positions ks of the flattened array once sorted, NaNs are sorted last.
+    Integer arrays of a limited value range are counted into one histogram in blocks, its cumulative sum gives
+    every position in O(n). Other arrays are partitioned once at all positions together.
+    """
+    flat = arr.reshape(-1)
+    ks = np.asarray(ks, np.intp)
+    lo = None
+    if flat.dtype.kind in "iu" and flat.dtype.itemsize <= 2:
+        lo, hi = int(np.iinfo(flat.dtype).min), int(np.iinfo(flat.dtype).max)
+    elif flat.dtype.kind in "iu":
+        lo, hi = (int(v) for v in array_range(flat))
+        if hi - lo >= bincount_values:
+            lo = None
+    if lo is None:
+        return np.partition(flat, np.unique(ks))[ks]
+    counts = np.zeros(hi - lo + 1, np.intp)
+    for i in range(0, flat.size, block_values):
+        block = flat[i:i + block_values]
+        # bincount takes non-negative values only, unsigned blocks are counted as they are
+        counts += np.bincount(block if lo == 0 else block.astype(np.intp) - lo, minlength=counts.size)
+    return (np.searchsorted(np.cumsum(counts), ks, side="right") + lo).astype(flat.dtype)
+
+
+def percentiles(arr: np.array, q, extremes: bool = False):
+    """np.percentile(arr, p) (the default linear method) of every p of q, sharing one pass over the array.
+    With extremes, (min, max, percentiles) are returned.
+    """
+    n = arr.size
+    # the same positions and interpolation weights as numpy, so the results are the same
+    virtual = (n - 1) * np.true_divide(q, 100)
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    previous = np.where(virtual >= n - 1, n - 1, previous).astype(np.intp)
+    following = np.minimum(previous + 1, n - 1)
+    values = order_statistics(arr, np.concatenate(([0, n - 1], previous, following)))
+    if values.dtype.kind == "f" and np.isnan(values[1]):
+        result = [values[1]] * len(previous)
+        return (values[1], values[1], result) if extremes else result
+    result = []
+    for a, b, t in zip(values[2:len(previous) + 2], values[len(previous) + 2:], gamma):
+        diff, t = b - a, float(t)
+        result.append(b - diff * (1 - t) if t >= .5 else a + diff * t)
+    return (values[0], values[1], result) if extremes else result
 
 
 def limits(arr: np.array, index: int) -> tuple:
+    """Returns vmin, vmax of the limits_dict preset index."""
     if index == 0:  # min/max
-        vmin = arr.min()
-        vmax = arr.max()
-    elif index == 1:  # 1/99
-        vmin = np.percentile(arr, 1)
-        vmax = np.percentile(arr, 99)
-    elif index == 2:  # 5/95
-        vmin = np.percentile(arr, 5)
-        vmax = np.percentile(arr, 95)
-    elif index == 3:  # 0.1/99.9
-        vmin = np.percentile(arr, 0.1)
-        vmax = np.percentile(arr, 99.9)
-    elif index == 4:  # 0.01/99.99
-        vmin = np.percentile(arr, 0.01)
-        vmax = np.percentile(arr, 99.99)
-    elif index == 5:  # 0.001/99.999
-        vmin = np.percentile(arr, 0.001)
-        vmax = np.percentile(arr, 99.999)
+        vmin, vmax = arr.min(), arr.max()
+    elif index in limits_percentiles:  # percentiles
+        vmin, vmax = percentiles(arr, limits_percentiles[index])
     elif index == 6:  # min+1/max-1
-        vmin = arr.min() + 1
-        vmax = arr.max() - 1
+        vmin, vmax = arr.min() + 1, arr.max() - 1
     else:
         raise ValueError("Index out of range")
     return vmin, vmax
 
 
+def all_limits(arr: np.array) -> dict:
+    """Returns vmin, vmax of every limits_dict preset by its index, all from one pass over the array."""
+    q = [p for index in sorted(limits_percentiles) for p in limits_percentiles[index]]
+    vmin, vmax, values = percentiles(arr, q, extremes=True)
+    result = {0: (vmin, vmax), 6: (vmin + 1, vmax - 1)}
+    for i, index in enumerate(sorted(limits_percentiles)):
+        result[index] = (values[2 * i], values[2 * i + 1])
+    return result
+
+
 def get_config():
     try:
         import configparser